@@ -1,20 +1,30 @@
 
 import os
 import sys
+import asyncio
 import logging
-import json
 import time
 import datetime
-import traceback
+import calendar
+import hashlib
+import threading
 from typing import Optional, List, Dict, Any
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+import orjson
+import numpy as np
 import pandas as pd
+import httpx
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import LRUCache, TLRUCache, TTLCache
 from google.oauth2.service_account import Credentials # Ensure this is imported
 
 # 1. Disable SSL Warnings
@@ -42,6 +52,7 @@ try:
     from google.oauth2.service_account import Credentials
     import google.auth.exceptions
     import google.auth
+    import google.auth.transport.requests
     GEE_IMPORTED = True
 except ImportError:
     GEE_IMPORTED = False
@@ -54,6 +65,13 @@ except ImportError:
     BIGQUERY_AVAILABLE = False
     logger.warning("⚠️ Google Cloud BigQuery library not installed.")
 
+# BigQuery Storage read API (columnar Arrow downloads instead of paged JSON rows)
+try:
+    from google.cloud import bigquery_storage
+    BQSTORAGE_AVAILABLE = True
+except ImportError:
+    BQSTORAGE_AVAILABLE = False
+
 # Curl_CFFI
 try:
     from curl_cffi import requests as cffi_requests
@@ -61,6 +79,35 @@ try:
 except ImportError:
     CFFI_AVAILABLE = False
 
+# Diskcache (L2 response cache that survives restarts)
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+    logger.warning("⚠️ diskcache not installed. Analyze responses cached in memory only.")
+
+# Per-route request metrics (/metrics) and opt-in profiling (PROFILE=1)
+try:
+    from prometheus_fastapi_instrumentator import Instrumentator
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    logger.warning("⚠️ prometheus-fastapi-instrumentator not installed. /metrics disabled.")
+
+try:
+    from pyinstrument import Profiler
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+
+# HTTP/2 for the outbound proxy clients (httpx[http2] extra)
+try:
+    import h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 
 # --- 4. GLOBAL STATE ---
 GLOBAL_STATE = {
@@ -68,10 +115,82 @@ GLOBAL_STATE = {
     "gee_error": None,
     "bq_ready": False,
     "bq_client": None,
+    "bqs_client": None,
     "active_project": None,
+    "creds_hash": None,
     "jq_ready": JQ_AVAILABLE
 }
 
+# Analyze responses are deterministic per request. Both tiers hold the encoded JSON bytes:
+# L1 in-process TTL cache, L2 on disk so the first users after a redeploy skip EE too.
+ANALYZE_CACHE = TTLCache(maxsize=256, ttl=3600)
+ANALYZE_CACHE_LOCK = threading.RLock()
+ANALYZE_DISK_TTL = 24 * 3600
+# Coarse near-match tier: same asset/year/windows within ~0.1 deg (see analyze_coarse_key)
+ANALYZE_COARSE_CACHE = LRUCache(maxsize=64)
+ANALYZE_DISK_CACHE = diskcache.Cache(
+    os.getenv("QA_CACHE_DIR", "/tmp/qagrify_cache"),
+    size_limit=2 * 2**30,
+    eviction_policy="least-recently-used"
+) if DISKCACHE_AVAILABLE else None
+# cache_key -> running analysis task, shared by concurrent identical requests
+ANALYZE_INFLIGHT: Dict[str, asyncio.Task] = {}
+
+# Credentials shared by the EE session and the BigQuery client. The lock serialises
+# hot swaps against the background token refresher.
+CLOUD_AUTH = {"credentials": None}
+CREDENTIALS_LOCK = threading.Lock()
+# Pooled session for OAuth token refreshes: keeps the TLS connection to the token endpoint warm
+AUTH_SESSION = requests.Session()
+AUTH_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                           max_retries=Retry(total=2, backoff_factor=0.3)))
+
+# Refresh OAuth tokens this long before they expire
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=6)
+
+# Successful USDA/TE proxy bodies (already enveloped). Upstream data changes daily at most;
+# keys are hashes of the full upstream request (API key included) so tenants never share entries.
+PROXY_CACHE = TTLCache(maxsize=512, ttl=3600)
+PROXY_ENVELOPE = (b'{"success":true,"data":', b'}')
+
+# Worker threads for blocking EE calls across all requests (the executor lives on app.state)
+EE_CONCURRENCY = 8
+
+# Encoded hybrid-price responses keyed on (symbol, frequency, start, end, JQ user), so
+# callers never see data fetched under another account's JQ session. Closed daily ranges
+# cannot change, anything touching today can gain bars at any moment. Only complete
+# results are stored: a response missing a failed source must not outlive the failure.
+PRICE_HISTORICAL_TTL = 12 * 3600
+PRICE_LIVE_TTL = 60
+
+def price_cache_ttu(key, value, now):
+    _, frequency, _, end_date, _ = key
+    historical = frequency in ('daily', '1d') and end_date < datetime.date.today().isoformat()
+    return now + (PRICE_HISTORICAL_TTL if historical else PRICE_LIVE_TTL)
+
+PRICE_CACHE = TLRUCache(maxsize=512, ttu=price_cache_ttu)
+
+# Days of JQ tail fetched speculatively while the BigQuery query runs
+JQ_SPECULATIVE_DAYS = 7
+
+# JQData keeps one session per process: remember a good login for a while instead of
+# pinging is_auth() on every price call, and serialise (re-)auth so bursts log in once
+JQ_AUTH_TTL = 600
+JQ_AUTH_CACHE: Dict[str, float] = {}
+JQ_AUTH_LOCK = threading.Lock()
+
+# Hot-swapped tenants: fingerprint of the service-account JSON -> (credentials, bq_client, bqs_client)
+CREDENTIALS_CACHE = LRUCache(maxsize=8)
+
+# Last successful EE liveness ping; dashboards poll /api/gee/status far more often than it changes
+GEE_PING_TTL = 30
+LAST_PING: Dict[str, Any] = {"t": 0.0, "resp": None}
+# Same idea for the BigQuery permission check (list_datasets)
+LAST_BQ_CHECK: Dict[str, Any] = {"t": 0.0, "resp": None}
+
+# Request-invariant EE objects, rebuilt whenever the EE session is (re)initialised
+EE_OBJECT_CACHE: Dict[str, Any] = {}
+
 # Scope needed for Earth Engine REST API
 GEE_SCOPES = ['https://www.googleapis.com/auth/earthengine', 'https://www.googleapis.com/auth/bigquery']
 
@@ -79,14 +198,32 @@ def attempt_cloud_connection(creds_json: Optional[Dict] = None) -> bool:
     """
     Connect to Google Cloud Services (GEE & BigQuery).
     """
+    creds_hash = None
+    if creds_json:
+        creds_hash = hashlib.sha256(orjson.dumps(creds_json, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    with CREDENTIALS_LOCK:
+        # Status polls re-send the active tenant's JSON: nothing to rebuild
+        if creds_hash and creds_hash == GLOBAL_STATE["creds_hash"] and (GLOBAL_STATE["gee_ready"] or GLOBAL_STATE["bq_ready"]):
+            return True
+        return _connect_cloud(creds_json, creds_hash)
+
+def _connect_cloud(creds_json: Optional[Dict] = None, creds_hash: Optional[str] = None) -> bool:
     global GLOBAL_STATE
     
     credentials = None
     project_id = None
+    bq_client = None
+    bqs_client = None
 
     try:
         # Step 1: Resolve Credentials
-        if creds_json:
+        if creds_json and creds_hash in CREDENTIALS_CACHE:
+            # Hot Swap back to a recently used tenant
+            logger.info("🔑 Cloud: Reusing cached credentials for provided JSON...")
+            credentials, bq_client, bqs_client = CREDENTIALS_CACHE[creds_hash]
+            project_id = creds_json.get('project_id')
+
+        elif creds_json:
             # Hot Swap
             logger.info("🔑 Cloud: Using provided JSON credentials from Client...")
             credentials = Credentials.from_service_account_info(creds_json, scopes=GEE_SCOPES)
@@ -96,10 +233,10 @@ def attempt_cloud_connection(creds_json: Optional[Dict] = None) -> bool:
             # Env Var
             logger.info("🔑 Cloud: Found GEE_SERVICE_ACCOUNT env var...")
             try:
-                service_account_info = json.loads(os.environ.get("GEE_SERVICE_ACCOUNT"))
+                service_account_info = orjson.loads(os.environ.get("GEE_SERVICE_ACCOUNT"))
                 credentials = Credentials.from_service_account_info(service_account_info, scopes=GEE_SCOPES)
                 project_id = service_account_info.get('project_id')
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 error_msg = "GEE_SERVICE_ACCOUNT is not valid JSON."
                 logger.error(f"❌ {error_msg}")
                 GLOBAL_STATE["gee_error"] = error_msg
@@ -127,6 +264,8 @@ def attempt_cloud_connection(creds_json: Optional[Dict] = None) -> bool:
             try:
                 logger.info(f"🌍 GEE: Initializing (Project: {project_id})...")
                 ee.Initialize(credentials=credentials, project=project_id)
+                EE_OBJECT_CACHE.clear()
+                LAST_PING["t"] = 0.0
                 GLOBAL_STATE["gee_ready"] = True
                 GLOBAL_STATE["gee_error"] = None
                 GLOBAL_STATE["active_project"] = project_id
@@ -138,8 +277,17 @@ def attempt_cloud_connection(creds_json: Optional[Dict] = None) -> bool:
         # Step 3: Initialize BigQuery
         if BIGQUERY_AVAILABLE and credentials:
             try:
-                logger.info(f"🗄️ BigQuery: Initializing Client...")
-                GLOBAL_STATE["bq_client"] = bigquery.Client(credentials=credentials, project=project_id)
+                if bq_client is None:
+                    logger.info(f"🗄️ BigQuery: Initializing Client...")
+                    bq_client = bigquery.Client(credentials=credentials, project=project_id)
+                GLOBAL_STATE["bq_client"] = bq_client
+                LAST_BQ_CHECK["t"] = 0.0
+                if BQSTORAGE_AVAILABLE and bqs_client is None:
+                    try:
+                        bqs_client = bigquery_storage.BigQueryReadClient(credentials=credentials)
+                    except Exception as e:
+                        logger.warning(f"⚠️ BigQuery Storage client unavailable, using REST downloads: {e}")
+                GLOBAL_STATE["bqs_client"] = bqs_client
                 GLOBAL_STATE["bq_ready"] = True
                 # Force project ID update if hot-swapped
                 GLOBAL_STATE["active_project"] = project_id 
@@ -148,32 +296,117 @@ def attempt_cloud_connection(creds_json: Optional[Dict] = None) -> bool:
                 logger.error(f"❌ BigQuery Init Failed: {e}")
                 GLOBAL_STATE["bq_ready"] = False
 
+        if credentials:
+            CLOUD_AUTH["credentials"] = credentials
+            if creds_hash:
+                CREDENTIALS_CACHE[creds_hash] = (credentials, bq_client, bqs_client)
+        GLOBAL_STATE["creds_hash"] = creds_hash
+
         return True
 
     except Exception as e:
-        logger.error(f"❌ Cloud Critical Failure: {str(e)}")
-        traceback.print_exc()
+        logger.exception(f"❌ Cloud Critical Failure: {str(e)}")
         return False
     
     return False
 
 
+def refresh_credentials(credentials) -> None:
+    with CREDENTIALS_LOCK:
+        # Skip if a hot swap replaced these credentials while we were waiting
+        if CLOUD_AUTH["credentials"] is credentials:
+            credentials.refresh(google.auth.transport.requests.Request(session=AUTH_SESSION))
+
+async def token_refresher():
+    """
+    Refresh the shared OAuth token shortly before it expires, so request handlers
+    never pay the token exchange inline.
+    """
+    while True:
+        credentials = CLOUD_AUTH["credentials"]
+        if credentials is None:
+            await asyncio.sleep(60)
+            continue
+
+        expiry = getattr(credentials, "expiry", None)
+        if expiry is not None:
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            sleep_for = (expiry - now - TOKEN_REFRESH_MARGIN).total_seconds()
+            if sleep_for > 0:
+                # Wake at least once a minute so hot-swapped credentials are picked up promptly
+                await asyncio.sleep(min(sleep_for, 60))
+                continue
+        elif getattr(credentials, "token", None):
+            # Token without an expiry never needs refreshing
+            await asyncio.sleep(60)
+            continue
+
+        # Fresh credentials carry no token yet: fetch one now rather than on the first request
+        try:
+            await asyncio.to_thread(refresh_credentials, credentials)
+            logger.info("🔑 Cloud: OAuth token pre-refreshed.")
+        except Exception as e:
+            logger.warning(f"⚠️ Token pre-refresh failed: {e}")
+            await asyncio.sleep(60)
+
 # --- 5. APP LIFESPAN ---
 @asynccontextmanager
-async def lifespan(app: FastAPI):
+async def cloud_lifespan(app: FastAPI):
     # Startup: Try to connect, but don't block/fail app if it errors
     try:
         logger.info("🟢 System Startup...")
         attempt_cloud_connection()
     except Exception as e:
         logger.error(f"⚠️ Startup Error (Non-Fatal): {e}")
+    refresher = asyncio.create_task(token_refresher()) if GEE_IMPORTED else None
+    app.state.ee_executor = ThreadPoolExecutor(max_workers=EE_CONCURRENCY, thread_name_prefix="ee")
     yield
+    if refresher:
+        refresher.cancel()
+    app.state.ee_executor.shutdown(wait=False, cancel_futures=True)
+
+@asynccontextmanager
+async def http_lifespan(app: FastAPI):
+    # Shared keep-alive outbound clients for the proxy routes (USDA hosts need verify=False)
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60)
+    app.state.http = httpx.AsyncClient(timeout=20, follow_redirects=True, http2=HTTP2_AVAILABLE, limits=limits)
+    app.state.usda_http = httpx.AsyncClient(timeout=20, follow_redirects=True, verify=False,
+                                            http2=HTTP2_AVAILABLE, limits=limits)
+    yield
+    await app.state.http.aclose()
+    await app.state.usda_http.aclose()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Entered in order, torn down in reverse
+    async with AsyncExitStack() as stack:
+        for component in (cloud_lifespan, http_lifespan):
+            await stack.enter_async_context(component(app))
+        yield
     logger.info("🔴 System Shutdown.")
 
+def get_bq_client() -> Optional[Any]:
+    """BigQuery client of the active tenant (None if not ready). Override via app.dependency_overrides."""
+    return GLOBAL_STATE["bq_client"] if GLOBAL_STATE["bq_ready"] else None
+
+def get_bqstorage_client() -> Optional[Any]:
+    """Storage read client paired with get_bq_client; None falls back to the REST download."""
+    return GLOBAL_STATE["bqs_client"] if GLOBAL_STATE["bq_ready"] else None
+
 # Set Current Version
 CURRENT_VERSION = "3.4.0-FeepTestGoingOn"
 
-app = FastAPI(title="QuantAgrify Middleware", version=CURRENT_VERSION, lifespan=lifespan)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+class OrjsonResponse(JSONResponse):
+    """
+    Default response class: orjson encoding, including numpy scalars/arrays from pandas.
+    (FastAPI's own ORJSONResponse is deprecated in recent releases.)
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+app = FastAPI(title="QuantAgrify Middleware", version=CURRENT_VERSION, lifespan=lifespan, default_response_class=OrjsonResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -183,6 +416,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if PROMETHEUS_AVAILABLE:
+    Instrumentator().instrument(app).expose(app, include_in_schema=False)
+
+if os.getenv("PROFILE") == "1" and PYINSTRUMENT_AVAILABLE:
+    logger.info("🧪 Profiling enabled: add ?profile=1 to any request for a pyinstrument report.")
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if "profile" not in request.query_params:
+            return await call_next(request)
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        await call_next(request)
+        profiler.stop()
+        return Response(content=profiler.output_html(), media_type="text/html")
+
 
 # --- REQUEST MODELS ---
 class GeeAnalysisRequest(BaseModel):
@@ -219,6 +468,165 @@ class ProxyRequest(BaseModel):
     endpoint: str = ""
     token: str = "" 
 
+# Grid used to snap analyze requests: 0.01 deg (~1km) and whole ISO weeks
+ANALYZE_GRID_DEG = 0.01
+
+def snap_analysis_request(payload: GeeAnalysisRequest) -> GeeAnalysisRequest:
+    """
+    Quantize ROI and date fields so UI jitter maps to identical EE computations.
+    Start dates floor to the Monday of their ISO week, end dates extend to the Sunday,
+    so the snapped window always covers the requested one.
+    """
+    def week_start(date_str):
+        dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        return (dt - datetime.timedelta(days=dt.weekday())).strftime("%Y-%m-%d")
+
+    def week_end(date_str):
+        dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        return (dt + datetime.timedelta(days=6 - dt.weekday())).strftime("%Y-%m-%d")
+
+    return payload.model_copy(update={
+        "lat": round(round(payload.lat / ANALYZE_GRID_DEG) * ANALYZE_GRID_DEG, 2),
+        "lon": round(round(payload.lon / ANALYZE_GRID_DEG) * ANALYZE_GRID_DEG, 2),
+        "full_season_start": week_start(payload.full_season_start),
+        "full_season_end": week_end(payload.full_season_end),
+        "stage_start": week_start(payload.stage_start),
+        "stage_end": week_end(payload.stage_end),
+    })
+
+def shift_date(date_str: str, diff: int) -> str:
+    """Moves a YYYY-MM-DD date back diff years by string slicing; Feb 29 clamps to Feb 28."""
+    year = int(date_str[:4]) - diff
+    rest = date_str[4:10]
+    if rest == "-02-29" and not calendar.isleap(year):
+        rest = "-02-28"
+    return f"{year:04d}{rest}"
+
+def analyze_cache_key(payload: GeeAnalysisRequest) -> str:
+    """
+    Stable hash of an analyze request (expects a payload already passed through snap_analysis_request).
+    """
+    raw = orjson.dumps(payload.model_dump(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+# NDVI histogram bins for the analyze reduction (bin width 0.01)
+NDVI_HIST_MIN, NDVI_HIST_MAX, NDVI_HIST_STEPS = -1, 1, 200
+
+def analyze_coarse_key(payload: GeeAnalysisRequest) -> str:
+    key = f"{payload.asset_name}-{payload.target_year}-{round(payload.lat, 1)}-{round(payload.lon, 1)}"
+    # The time windows stay in the key: only the location is allowed to be approximate
+    return (f"{key}-{payload.compare_year}-{payload.buffer_radius}-{payload.full_season_start}-"
+            f"{payload.full_season_end}-{payload.stage_start}-{payload.stage_end}")
+
+def extract_points(rows: List[Dict]) -> List[Dict]:
+    """Chart points from fetch_ndvi_series rows: histogram mode per image, images over 100 pixels only."""
+    rows = [r for r in rows if r.get('hist') and r.get('count') is not None]
+    if not rows:
+        return []
+    # (images, bins, [bucket_min, count]) in one conversion
+    hist = np.asarray([r['hist'] for r in rows], dtype=np.float64)
+    counts = hist[:, :, 1]
+    width = (NDVI_HIST_MAX - NDVI_HIST_MIN) / NDVI_HIST_STEPS
+    points = pd.DataFrame({
+        'date': [r['date'] for r in rows],
+        'ndvi': (hist[np.arange(len(rows)), counts.argmax(axis=1), 0] + width / 2).round(4),
+        'timestamp': [r['millis'] for r in rows],
+        'count': [r['count'] for r in rows],
+    })
+    points = points[points['count'] > 100].sort_values('date', kind='stable')
+    return points[['date', 'ndvi', 'timestamp']].to_dict('records')
+
+def proxy_cache_key(url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None) -> str:
+    raw = orjson.dumps([url, sorted((params or {}).items()), sorted((headers or {}).items())])
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+async def relay_json(client: httpx.AsyncClient, cache_key: str, url: str, **kwargs):
+    """Streams a JSON upstream body into the {"success","data"} envelope without re-parsing it."""
+    cached = PROXY_CACHE.get(cache_key)
+    if cached is not None:
+        return Response(cached, media_type="application/json", headers={"X-Proxy-Success": "1", "X-Proxy-Cache": "hit"})
+    try:
+        res = await client.send(client.build_request("GET", url, **kwargs), stream=True)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+    if res.is_error or "json" not in res.headers.get("content-type", ""):
+        body = await res.aread()
+        await res.aclose()
+        text = body.decode(res.encoding or "utf-8", errors="replace")
+        if res.is_error:
+            return {"success": False, "status": res.status_code, "error": text[:200]}
+        # Some upstreams label JSON as text/plain or text/html: trust the body, not the header
+        try:
+            orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return {"success": False, "data": text}
+        enveloped = PROXY_ENVELOPE[0] + body + PROXY_ENVELOPE[1]
+        PROXY_CACHE[cache_key] = enveloped
+        return Response(enveloped, media_type="application/json", headers={"X-Proxy-Success": "1"})
+
+    chunks = res.aiter_bytes()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    if not first:
+        await res.aclose()
+        return {"success": True, "data": None}
+
+    async def relay():
+        parts = [PROXY_ENVELOPE[0], first]
+        try:
+            yield PROXY_ENVELOPE[0]
+            yield first
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+            yield PROXY_ENVELOPE[1]
+            parts.append(PROXY_ENVELOPE[1])
+            PROXY_CACHE[cache_key] = b"".join(parts)
+        finally:
+            await res.aclose()
+
+    return StreamingResponse(relay(), media_type="application/json", headers={"X-Proxy-Success": "1"})
+
+async def run_ee_call(executor: ThreadPoolExecutor, fn, *args):
+    """Runs a blocking EE call on the dedicated EE pool, so EE load cannot starve the default one."""
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+def get_worldcover():
+    """ESA WorldCover reference image, shared by every analyze request."""
+    worldcover = EE_OBJECT_CACHE.get("worldcover")
+    if worldcover is None:
+        worldcover = ee.ImageCollection("ESA/WorldCover/v200").first()
+        EE_OBJECT_CACHE["worldcover"] = worldcover
+    return worldcover
+
+def process_common_clouds(image):
+    qa = image.select('QA60')
+    cloud_bit_mask = 1 << 10
+    cirrus_bit_mask = 1 << 11
+    mask = qa.bitwiseAnd(cloud_bit_mask).eq(0).And(qa.bitwiseAnd(cirrus_bit_mask).eq(0))
+    return image.updateMask(mask).divide(10000).copyProperties(image, ["system:time_start"])
+
+async def get_cached_analysis(cache_key: str) -> Optional[bytes]:
+    with ANALYZE_CACHE_LOCK:
+        body = ANALYZE_CACHE.get(cache_key)
+    if body is None and ANALYZE_DISK_CACHE is not None:
+        # diskcache does blocking SQLite I/O: keep it off the event loop
+        body = await asyncio.to_thread(ANALYZE_DISK_CACHE.get, cache_key)
+        if body is not None:
+            # Promote L2 hit into L1
+            with ANALYZE_CACHE_LOCK:
+                ANALYZE_CACHE[cache_key] = body
+    return body
+
+async def store_cached_analysis(cache_key: str, body: bytes) -> None:
+    with ANALYZE_CACHE_LOCK:
+        ANALYZE_CACHE[cache_key] = body
+    if ANALYZE_DISK_CACHE is not None:
+        await asyncio.to_thread(ANALYZE_DISK_CACHE.set, cache_key, body, expire=ANALYZE_DISK_TTL)
+
 # --- ROUTES ---
 
 @app.get("/")
@@ -235,12 +643,12 @@ def health_check():
     return {"status": "ok"}
 
 @app.post("/api/gee/status")
-def check_gee_status(payload: GeeStatusRequest):
+async def check_gee_status(payload: GeeStatusRequest):
     credentials_loaded = False
     
     if payload.credentials:
         logger.info("🔄 API Trigger: Hot Swapping Credentials...")
-        success = attempt_cloud_connection(payload.credentials)
+        success = await asyncio.to_thread(attempt_cloud_connection, payload.credentials)
         if success:
             credentials_loaded = True
         else:
@@ -248,27 +656,56 @@ def check_gee_status(payload: GeeStatusRequest):
 
     if not GLOBAL_STATE["gee_ready"]:
          return {"success": False, "status": "NOT_CONFIGURED", "error": GLOBAL_STATE["gee_error"]}
-         
+
+    if not credentials_loaded and time.time() - LAST_PING["t"] < GEE_PING_TTL:
+        return LAST_PING["resp"]
+
     try:
-        val = ee.Number(1).getInfo() 
-        return {
+        val = await asyncio.to_thread(ee.Number(1).getInfo)
+        resp = {
             "success": True,
             "status": "ONLINE",
             "project": GLOBAL_STATE["active_project"],
             "backend_version": CURRENT_VERSION,
-            "credentials_loaded": credentials_loaded
+            "credentials_loaded": False
         }
+        LAST_PING.update(t=time.time(), resp=resp)
+        return {**resp, "credentials_loaded": credentials_loaded}
     except Exception as e:
+        LAST_PING["t"] = 0.0
         return {"success": False, "status": "ERROR", "error": str(e)}
 
+def status_response(request: Request, resp: Dict) -> Response:
+    """Status body with a content ETag and max-age; answers 304 when the poller already has it.
+    Failures are sent no-store so clients re-check as soon as the service recovers."""
+    body = orjson.dumps(resp, option=ORJSON_OPTIONS)
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    cache_control = f"max-age={GEE_PING_TTL}" if resp.get("success") else "no-store"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/gee/status")
+async def ping_gee_status(request: Request):
+    """Body-less liveness poll; credential hot-swaps go through the POST route."""
+    if time.time() - LAST_PING["t"] < GEE_PING_TTL:
+        return status_response(request, LAST_PING["resp"])
+    return status_response(request, await check_gee_status(GeeStatusRequest()))
+
+@app.get("/api/bigquery/status")
+async def ping_bigquery_status(request: Request):
+    """Body-less BigQuery poll, mirroring GET /api/gee/status."""
+    return status_response(request, await check_bigquery_status(GeeStatusRequest()))
+
 @app.post("/api/bigquery/status")
-def check_bigquery_status(payload: GeeStatusRequest):
+async def check_bigquery_status(payload: GeeStatusRequest):
     credentials_loaded = False
     
     # Reuse the same cloud connection logic as GEE
     if payload.credentials:
         logger.info("🔄 API Trigger: Hot Swapping Credentials for BigQuery...")
-        success = attempt_cloud_connection(payload.credentials)
+        success = await asyncio.to_thread(attempt_cloud_connection, payload.credentials)
         if success:
             credentials_loaded = True
         else:
@@ -276,27 +713,58 @@ def check_bigquery_status(payload: GeeStatusRequest):
 
     if not GLOBAL_STATE["bq_ready"] or not GLOBAL_STATE["bq_client"]:
          return {"success": False, "status": "NOT_CONFIGURED", "error": "BigQuery client not initialized"}
+
+    if not credentials_loaded and time.time() - LAST_BQ_CHECK["t"] < GEE_PING_TTL:
+        return LAST_BQ_CHECK["resp"]
          
     try:
         # Try to list datasets to verify permissions
-        datasets = list(GLOBAL_STATE["bq_client"].list_datasets())
+        datasets = await asyncio.to_thread(lambda: list(GLOBAL_STATE["bq_client"].list_datasets()))
         dataset_ids = [d.dataset_id for d in datasets]
         
-        return {
+        resp = {
             "success": True,
             "status": "ONLINE",
             "project": GLOBAL_STATE["active_project"],
             "datasets_found": dataset_ids,
-            "credentials_loaded": credentials_loaded
+            "credentials_loaded": False
         }
+        LAST_BQ_CHECK.update(t=time.time(), resp=resp)
+        return {**resp, "credentials_loaded": credentials_loaded}
     except Exception as e:
+        LAST_BQ_CHECK["t"] = 0.0
         return {"success": False, "status": "PERMISSION_ERROR", "error": str(e)}
 
 @app.post("/api/gee/analyze")
-def analyze_satellite_data(payload: GeeAnalysisRequest):
+async def analyze_satellite_data(payload: GeeAnalysisRequest, request: Request):
     if not GLOBAL_STATE["gee_ready"]:
         raise HTTPException(status_code=503, detail="GEE Not Ready")
 
+    try:
+        payload = snap_analysis_request(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid date (expected YYYY-MM-DD): {e}")
+    cache_key = analyze_cache_key(payload)
+    cached = await get_cached_analysis(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    coarse = ANALYZE_COARSE_CACHE.get(analyze_coarse_key(payload))
+    if coarse is not None:
+        # Splice the marker into the stored object instead of decoding it
+        return Response(content=coarse[:-1] + b',"cache_hit":"coarse"}', media_type="application/json")
+
+    # Concurrent identical requests await the same EE computation.
+    # No await between lookup and insert, so this is atomic on the event loop.
+    task = ANALYZE_INFLIGHT.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(run_satellite_analysis(payload, cache_key, request.app.state.ee_executor))
+        ANALYZE_INFLIGHT[cache_key] = task
+        task.add_done_callback(lambda _: ANALYZE_INFLIGHT.pop(cache_key, None))
+    # shield: one client disconnecting must not cancel the work other callers wait on
+    body = await asyncio.shield(task)
+    return Response(content=body, media_type="application/json")
+
+async def run_satellite_analysis(payload: GeeAnalysisRequest, cache_key: str, executor: ThreadPoolExecutor) -> bytes:
     try:
         point = ee.Geometry.Point([payload.lon, payload.lat])
         aoi = point.buffer(payload.buffer_radius)
@@ -308,25 +776,11 @@ def analyze_satellite_data(payload: GeeAnalysisRequest):
         
         year_diff = payload.target_year - payload.compare_year
         
-        def shift_date(date_str, diff):
-            dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-            new_dt = dt.replace(year=dt.year - diff)
-            return new_dt.strftime("%Y-%m-%d")
+        c_season_start, c_season_end, c_stage_start, c_stage_end = (
+            shift_date(d, year_diff) for d in (t_season_start, t_season_end, t_stage_start, t_stage_end)
+        )
 
-        c_season_start = shift_date(t_season_start, year_diff)
-        c_season_end = shift_date(t_season_end, year_diff)
-        c_stage_start = shift_date(t_stage_start, year_diff)
-        c_stage_end = shift_date(t_stage_end, year_diff)
-
-        worldcover = ee.ImageCollection("ESA/WorldCover/v200").first()
-        cropland_mask = worldcover.select('Map').eq(40).clip(aoi)
-        
-        def process_common_clouds(image):
-            qa = image.select('QA60')
-            cloud_bit_mask = 1 << 10
-            cirrus_bit_mask = 1 << 11
-            mask = qa.bitwiseAnd(cloud_bit_mask).eq(0).And(qa.bitwiseAnd(cirrus_bit_mask).eq(0))
-            return image.updateMask(mask).divide(10000).copyProperties(image, ["system:time_start"])
+        cropland_mask = get_worldcover().select('Map').eq(40).clip(aoi)
 
         s2_visual = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
             .filterBounds(aoi) \
@@ -340,62 +794,99 @@ def analyze_satellite_data(payload: GeeAnalysisRequest):
 
         s2_analytics = s2_visual.map(process_analytics_bands)
 
-        def get_stats(image):
-            ndvi_scaled = image.select('NDVI').multiply(10000).int()
-            stats = ndvi_scaled.reduceRegion(
-                reducer=ee.Reducer.mode().combine(reducer2=ee.Reducer.count(), sharedInputs=True), 
-                geometry=aoi, scale=1000, maxPixels=1e9, bestEffort=True
+        def fetch_ndvi_series(start, end):
+            # One server-side reduction per season: stack every image's NDVI into a single
+            # multi-band image and reduce it once, instead of one reduceRegion per image.
+            season = s2_analytics.filterDate(start, end).map(
+                lambda image: image.select('NDVI').copyProperties(image, ["system:time_start"])
             )
-            return ee.Feature(None, {
-                'date': image.date().format('YYYY-MM-dd'),
-                'ndvi': stats.get('NDVI_mode'), 
-                'count': stats.get('NDVI_count'),
-                'millis': image.date().millis()
-            })
-
-        target_fc = s2_analytics.filterDate(t_season_start, t_season_end).map(get_stats).getInfo()
-        compare_fc = s2_analytics.filterDate(c_season_start, c_season_end).map(get_stats).getInfo()
+            stats = season.toBands().reduceRegion(
+                # count() alongside: the histogram is weighted by pixel coverage, the
+                # >100 pixel filter is on the plain (unweighted) pixel count
+                reducer=ee.Reducer.fixedHistogram(NDVI_HIST_MIN, NDVI_HIST_MAX, NDVI_HIST_STEPS)
+                    .combine(reducer2=ee.Reducer.count(), sharedInputs=True),
+                geometry=aoi, scale=1000, maxPixels=1e9, bestEffort=True, tileScale=4
+            )
+            result = ee.Dictionary({
+                'ids': season.aggregate_array('system:index'),
+                'millis': season.aggregate_array('system:time_start'),
+                'stats': stats
+            }).getInfo()
+
+            # Bands of toBands() are prefixed with each image's system:index
+            band_stats = result['stats'] or {}
+            rows = []
+            for img_id, millis in zip(result['ids'], result['millis']):
+                rows.append({
+                    'date': datetime.datetime.fromtimestamp(millis / 1000, tz=datetime.timezone.utc).strftime("%Y-%m-%d"),
+                    'hist': band_stats.get(f"{img_id}_NDVI_histogram"),
+                    'count': band_stats.get(f"{img_id}_NDVI_count"),
+                    'millis': millis
+                })
+            return rows
 
         vis_params = {'min': 0.0, 'max': 0.3, 'bands': ['B4', 'B3', 'B2'], 'dimensions': 800, 'region': aoi, 'format': 'png'}
         
         def get_thumb(start, end):
-            try:
-                return s2_visual.filterDate(start, end).median().clip(aoi).getThumbURL(vis_params)
-            except: return None
-
-        target_url = get_thumb(t_stage_start, t_stage_end)
-        compare_url = get_thumb(c_stage_start, c_stage_end)
-
-        def extract_points(feature_collection):
-            points = []
-            if 'features' in feature_collection:
-                for f in feature_collection['features']:
-                    props = f['properties']
-                    val = props.get('ndvi')
-                    count = props.get('count')
-                    if val is not None and count is not None and count > 100: 
-                        points.append({'date': props['date'], 'ndvi': float(val) / 10000.0, 'timestamp': props['millis']})
-            points.sort(key=lambda x: x['date'])
-            return points
-
-        return {
+            return s2_visual.filterDate(start, end).median().clip(aoi).getThumbURL(vis_params)
+
+        # The four EE round trips are independent: run them concurrently on the EE pool
+        target_rows, compare_rows, target_url, compare_url = await asyncio.gather(
+            run_ee_call(executor, fetch_ndvi_series, t_season_start, t_season_end),
+            run_ee_call(executor, fetch_ndvi_series, c_season_start, c_season_end),
+            run_ee_call(executor, get_thumb, t_stage_start, t_stage_end),
+            run_ee_call(executor, get_thumb, c_stage_start, c_stage_end),
+            return_exceptions=True
+        )
+        # The chart series are required; a failed thumbnail just renders without an image
+        for series in (target_rows, compare_rows):
+            if isinstance(series, BaseException):
+                raise series
+        if isinstance(target_url, BaseException): target_url = None
+        if isinstance(compare_url, BaseException): compare_url = None
+
+        response = {
             "success": True,
             "images": {"target_year_url": target_url, "compare_year_url": compare_url},
-            "chart_data": {"target_year": extract_points(target_fc), "compare_year": extract_points(compare_fc)}
+            "chart_data": {"target_year": extract_points(target_rows), "compare_year": extract_points(compare_rows)}
         }
+        body = orjson.dumps(response)
+        await store_cached_analysis(cache_key, body)
+        ANALYZE_COARSE_CACHE[analyze_coarse_key(payload)] = body
+        return body
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/jqdata/auth")
-def auth_jq(payload: JQAuthRequest):
+async def auth_jq(payload: JQAuthRequest):
     if not JQ_AVAILABLE: raise HTTPException(status_code=501, detail="JQData SDK missing")
     try:
-        jq.auth(payload.username, payload.password)
+        def login():
+            with JQ_AUTH_LOCK:
+                jq.auth(payload.username, payload.password)
+                JQ_AUTH_CACHE[payload.username] = time.time() + JQ_AUTH_TTL
+        await asyncio.to_thread(login)
         return {"success": True, "status": "Authenticated"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def ensure_jq_auth(username: Optional[str], password: Optional[str]) -> bool:
+    if JQ_AUTH_CACHE.get(username or "", 0) > time.time():
+        return True
+    with JQ_AUTH_LOCK:
+        # Another thread may have logged in while we waited
+        if JQ_AUTH_CACHE.get(username or "", 0) > time.time():
+            return True
+        if not jq.is_auth():
+            if not (username and password):
+                return False
+            jq.auth(username, password)
+            if not jq.is_auth():
+                return False
+        JQ_AUTH_CACHE[username or ""] = time.time() + JQ_AUTH_TTL
+        return True
+
 def normalize_bq_symbol(symbol: str) -> str:
     """
     STRICT IDENTITY FUNCTION:
@@ -407,7 +898,8 @@ def normalize_bq_symbol(symbol: str) -> str:
     return symbol.strip()
 
 @app.post("/api/market/hybrid-price")
-def get_hybrid_price(payload: PriceRequest):
+async def get_hybrid_price(payload: PriceRequest, bq_client: Optional[Any] = Depends(get_bq_client),
+                           bqs_client: Optional[Any] = Depends(get_bqstorage_client)):
     """
     Hybrid Cloud Data Logic:
     1. Try BigQuery (Historical Archive) with Smart Aggregation.
@@ -419,7 +911,7 @@ def get_hybrid_price(payload: PriceRequest):
     bq_symbol = normalize_bq_symbol(symbol)
     
     # EXTRACT ROOT SYMBOL FOR BROAD SEARCH (e.g. "C9999.XDCE" -> "C9999")
-    # This allows searching via LIKE to handle any minor format discrepancies in the DB
+    # Prefix match on the root tolerates exchange-suffix discrepancies in the DB
     root_symbol = bq_symbol.split('.')[0] if '.' in bq_symbol else bq_symbol
     
     start_date = payload.start_date
@@ -431,20 +923,55 @@ def get_hybrid_price(payload: PriceRequest):
     if not end_date:
         end_date = datetime.datetime.now().strftime("%Y-%m-%d")
 
+    cache_key = (bq_symbol, frequency, start_date, end_date, payload.username or "")
+    cached = PRICE_CACHE.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    def fetch_jq_price(jq_from):
+        if not ensure_jq_auth(payload.username, payload.password):
+            return None
+        logger.info(f"📡 Hybrid: Fetching JQData from {jq_from}...")
+        jq_freq = '1m' if frequency in ['1m', 'minute'] else 'daily'
+        return jq.get_price(security=symbol, start_date=jq_from, end_date=end_date, frequency=jq_freq)
+
+    # Speculative JQ tail: BQ normally covers all but the last few days, so fetch that tail
+    # while the BQ query runs. If BQ turns out complete (or the gap is longer), one small
+    # JQ call is wasted; otherwise the JQ latency disappears behind BQ's.
+    jq_spec_task = None
+    if bq_client is not None and JQ_AVAILABLE:
+        try:
+            spec_start = max(start_date, (datetime.date.fromisoformat(end_date[:10])
+                                          - datetime.timedelta(days=JQ_SPECULATIVE_DAYS)).isoformat())
+        except ValueError:
+            # Unparseable end_date: skip speculation and let the phases below report it
+            spec_start = None
+        if spec_start is not None:
+            jq_spec_task = asyncio.ensure_future(asyncio.to_thread(fetch_jq_price, spec_start))
+            # Unused or failed speculation must not surface as "exception never retrieved"
+            jq_spec_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
     bq_df = pd.DataFrame()
     source_label = "JQData (Live)" # Default if BQ fails
+    degraded = False  # A source errored: serve the partial result but don't cache it
     
     # --- PHASE 1: BIGQUERY SMART QUERY ---
-    if GLOBAL_STATE["bq_ready"] and GLOBAL_STATE["bq_client"]:
+    if bq_client is not None:
         try:
             logger.info(f"🔍 Hybrid: Checking BigQuery for {bq_symbol} (Root: {root_symbol}) ({start_date} to {end_date}, Freq: {frequency})...")
             
             table_id = f"{GLOBAL_STATE['active_project']}.quant_database.futures_1min"
+            # Bound parameters: no injection via the symbol, and BQ can reuse the compiled plan
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter("root", "STRING", root_symbol),
+                bigquery.ScalarQueryParameter("start_date", "DATE", datetime.date.fromisoformat(start_date[:10])),
+                bigquery.ScalarQueryParameter("end_date", "DATE", datetime.date.fromisoformat(end_date[:10])),
+            ])
             
             if frequency == 'daily' or frequency == '1d':
                 # AGGREGATION QUERY: 1min -> Daily OHLCV
                 # Using timestamp_field_0 as per user verification
-                # BROAD MATCHING: Use LIKE with root_symbol
+                # PREFIX MATCHING: STARTS_WITH keeps the clustered contract column prunable
                 query = f"""
                     SELECT 
                         FORMAT_TIMESTAMP('%Y-%m-%d', timestamp_field_0) as date_str,
@@ -454,9 +981,10 @@ def get_hybrid_price(payload: PriceRequest):
                         ARRAY_AGG(close ORDER BY timestamp_field_0 DESC LIMIT 1)[OFFSET(0)] as close,
                         SUM(volume) as volume
                     FROM `{table_id}`
-                    WHERE contract LIKE '%{root_symbol}%'
-                    AND timestamp_field_0 >= TIMESTAMP('{start_date}') 
-                    AND timestamp_field_0 < TIMESTAMP_ADD(TIMESTAMP('{end_date}'), INTERVAL 1 DAY)
+                    WHERE STARTS_WITH(contract, @root)
+                    AND timestamp_field_0 >= TIMESTAMP(@start_date)
+                    AND timestamp_field_0 < TIMESTAMP_ADD(TIMESTAMP(@end_date), INTERVAL 1 DAY)
+                    AND DATE(timestamp_field_0) BETWEEN @start_date AND @end_date
                     GROUP BY date_str
                     ORDER BY date_str ASC
                 """
@@ -464,41 +992,40 @@ def get_hybrid_price(payload: PriceRequest):
             else:
                 # RAW QUERY: 1min
                 # UPGRADED LIMIT to 50000
-                # BROAD MATCHING: Use LIKE with root_symbol
+                # PREFIX MATCHING: STARTS_WITH keeps the clustered contract column prunable
                 query = f"""
                     SELECT 
                         FORMAT_TIMESTAMP('%Y-%m-%d %H:%M:%S', timestamp_field_0) as date_str,
                         open, high, low, close, volume
                     FROM `{table_id}`
-                    WHERE contract LIKE '%{root_symbol}%'
-                    AND timestamp_field_0 >= TIMESTAMP('{start_date}') 
-                    AND timestamp_field_0 < TIMESTAMP_ADD(TIMESTAMP('{end_date}'), INTERVAL 1 DAY)
+                    WHERE STARTS_WITH(contract, @root)
+                    AND timestamp_field_0 >= TIMESTAMP(@start_date)
+                    AND timestamp_field_0 < TIMESTAMP_ADD(TIMESTAMP(@end_date), INTERVAL 1 DAY)
+                    AND DATE(timestamp_field_0) BETWEEN @start_date AND @end_date
                     ORDER BY timestamp_field_0 ASC
                     LIMIT 50000 
                 """
                 label_suffix = "(Raw 1min)"
             
-            query_job = GLOBAL_STATE["bq_client"].query(query)
-            rows = list(query_job.result())
+            query_job = await asyncio.to_thread(bq_client.query, query, job_config=job_config)
+            # Columnar Arrow download (Storage API for large results), one conversion to pandas
+            result_df = await asyncio.to_thread(
+                lambda: query_job.result().to_arrow(bqstorage_client=bqs_client, create_bqstorage_client=False).to_pandas()
+            )
             
-            if rows:
-                bq_data = []
-                for row in rows:
-                    bq_data.append({
-                        "date": row.date_str,
-                        "open": float(row.open),
-                        "high": float(row.high),
-                        "low": float(row.low),
-                        "close": float(row.close),
-                        "volume": float(row.volume) if row.volume is not None else 0.0
-                    })
-                bq_df = pd.DataFrame(bq_data)
-                logger.info(f"✅ Hybrid: BQ returned {len(bq_df)} rows for {bq_symbol}.")
+            if not result_df.empty:
+                # Column-wise casts instead of a per-row float() loop
+                bq_df = result_df.rename(columns={"date_str": "date"})
+                bq_df["volume"] = bq_df["volume"].fillna(0)
+                bq_df = bq_df.astype({c: "float64" for c in ["open", "high", "low", "close", "volume"]})
+                logger.info(f"✅ Hybrid: BQ returned {len(bq_df)} rows for {bq_symbol} "
+                            f"({(query_job.total_bytes_processed or 0) / 2**20:.1f} MiB scanned).")
                 source_label = f"BigQuery {label_suffix}"
             else:
                 logger.info(f"⚠️ Hybrid: BQ returned 0 rows for {bq_symbol} (Root: {root_symbol}). Fallback to JQ.")
 
         except Exception as e:
+            degraded = True
             logger.error(f"❌ Hybrid: BigQuery Error: {e}")
 
     # --- PHASE 2: GAP DETECTION & JQDATA FILL ---
@@ -528,32 +1055,35 @@ def get_hybrid_price(payload: PriceRequest):
     # JQData Fallback / Fill
     if needs_jq and JQ_AVAILABLE:
         try:
-            if not jq.is_auth():
-                if payload.username and payload.password:
-                    jq.auth(payload.username, payload.password)
-            
-            if jq.is_auth():
-                logger.info(f"📡 Hybrid: Fetching JQData from {jq_start_date}...")
-                jq_freq = '1m' if frequency in ['1m', 'minute'] else 'daily'
-                df = jq.get_price(security=symbol, start_date=jq_start_date, end_date=end_date, frequency=jq_freq)
-                if not df.empty:
-                    df = df.reset_index()
-                    df.columns = df.columns.str.lower()
-                    if 'index' in df.columns:
-                        df = df.rename(columns={'index': 'date'})
-                    df['date'] = df['date'].astype(str)
-                    jq_df = df[['date', 'open', 'high', 'low', 'close', 'volume']]
-                    logger.info(f"✅ Hybrid: JQData returned {len(jq_df)} rows.")
+            if jq_spec_task is not None and not bq_df.empty and jq_start_date >= spec_start:
+                # The speculative tail covers the gap; rows before it are dropped at fusion
+                df = await jq_spec_task
+            else:
+                df = await asyncio.to_thread(fetch_jq_price, jq_start_date)
+            if df is None:
+                degraded = True  # JQ login failed
+            elif not df.empty:
+                df = df.reset_index()
+                df.columns = df.columns.str.lower()
+                if 'index' in df.columns:
+                    df = df.rename(columns={'index': 'date'})
+                df['date'] = df['date'].astype(str)
+                jq_df = df[['date', 'open', 'high', 'low', 'close', 'volume']]
+                logger.info(f"✅ Hybrid: JQData returned {len(jq_df)} rows.")
         except Exception as e:
+            # The session may have expired behind the cache: re-check on the next call
+            JQ_AUTH_CACHE.clear()
+            degraded = True
             logger.error(f"❌ Hybrid: JQData Error: {e}")
 
     # --- PHASE 3: FUSION ---
     final_df = pd.DataFrame()
     
     if not bq_df.empty and not jq_df.empty:
-        final_df = pd.concat([bq_df, jq_df])
-        final_df = final_df.drop_duplicates(subset=['date'], keep='last')
-        final_df = final_df.sort_values(by='date')
+        # Both frames are chronological: append only the JQ rows past the BQ tail
+        # (ISO date strings compare correctly), no dedupe hash or re-sort needed
+        jq_tail = jq_df[jq_df['date'] > bq_df['date'].iloc[-1]]
+        final_df = pd.concat([bq_df, jq_tail], ignore_index=True)
         source_label = f"Hybrid (BQ {label_suffix} + JQ)"
     elif not bq_df.empty:
         final_df = bq_df
@@ -564,52 +1094,44 @@ def get_hybrid_price(payload: PriceRequest):
     if final_df.empty:
         return {"success": False, "error": "No data found in BQ or JQ for this range."}
 
-    result_data = final_df.to_dict(orient='records')
-    
-    return {
-        "success": True, 
-        "data": result_data, 
-        "source": source_label,
-        "rows": len(result_data)
-    }
+    def encode_result() -> bytes:
+        # pandas' C JSON writer straight to bytes, spliced into the envelope:
+        # no per-row dicts are ever materialised
+        data = final_df.to_json(orient='records', double_precision=15).encode()
+        return (b'{"success":true,"data":' + data +
+                b',"source":' + orjson.dumps(source_label) +
+                b',"rows":' + str(len(final_df)).encode() + b'}')
+
+    body = await asyncio.to_thread(encode_result)
+    if not degraded:
+        PRICE_CACHE[cache_key] = body
+    return Response(content=body, media_type="application/json")
 
 # Keep legacy endpoint for compatibility
 @app.post("/api/jqdata/price")
-def get_price_legacy(payload: PriceRequest):
-    return get_hybrid_price(payload)
+async def get_price_legacy(payload: PriceRequest, bq_client: Optional[Any] = Depends(get_bq_client),
+                           bqs_client: Optional[Any] = Depends(get_bqstorage_client)):
+    return await get_hybrid_price(payload, bq_client, bqs_client)
 
 @app.post("/api/te/proxy")
-def proxy_te(payload: ProxyRequest):
+async def proxy_te(payload: ProxyRequest, request: Request):
     url = f"https://api.tradingeconomics.com/{payload.endpoint}?c={payload.apiKey}&f=json"
-    try:
-        res = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=15)
-        if res.status_code == 200:
-            return {"success": True, "data": res.json()}
-        return {"success": False, "status": res.status_code, "error": res.text[:200]}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+    return await relay_json(request.app.state.http, proxy_cache_key(url), url,
+                            headers={"User-Agent": "Mozilla/5.0"}, timeout=15)
 
 @app.post("/api/usda/proxy")
-def proxy_usda(payload: ProxyRequest):
+async def proxy_usda(payload: ProxyRequest, request: Request):
     url = f"https://apps.fas.usda.gov/psdonline/api/psd/{payload.endpoint}"
     headers = {"API_KEY": payload.apiKey}
-    try:
-        res = requests.get(url, headers=headers, timeout=20, verify=False)
-        if res.ok: return {"success": True, "data": res.json()}
-        return {"success": False, "status": res.status_code}
-    except Exception as e: return {"success": False, "error": str(e)}
+    return await relay_json(request.app.state.usda_http, proxy_cache_key(url, headers=headers), url,
+                            headers=headers, timeout=20)
 
 @app.get("/api/usda/quickstats")
-def proxy_usda_quickstats(request: Request):
+async def proxy_usda_quickstats(request: Request):
     url = "https://quickstats.nass.usda.gov/api/api_GET"
-    try:
-        params = dict(request.query_params)
-        res = requests.get(url, params=params, timeout=20, verify=False)
-        if res.ok:
-            try: return {"success": True, "data": res.json()}
-            except: return {"success": False, "data": res.text}
-        return {"success": False, "status": res.status_code}
-    except Exception as e: return {"success": False, "error": str(e)}
+    params = dict(request.query_params)
+    return await relay_json(request.app.state.usda_http, proxy_cache_key(url, params=params), url,
+                            params=params, timeout=20)
 
 if __name__ == "__main__":
     import uvicorn
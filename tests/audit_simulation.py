@@ -3,83 +3,131 @@ import numpy as np
 import pandas as pd
 import math
 
+# Numba is optional: without it the kernels below run as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
 # --- 1. SIMULATION GENERATOR (Replicating CustomUpload.tsx logic) ---
-def generate_sim_data():
+
+# Seasonality Logic (The "Script"), indexed by month 1-12 (index 0 unused): trend = (U + offset) * scale
+# Jan-Mar drift, Apr-May Planting, Jun-Jul Drought Pump, Aug-Sep Harvest Dump, Oct-Dec drift
+TREND_OFFSET = np.array([0, -0.45, -0.45, -0.45, -0.4, -0.4, -0.2, 0.2, -0.8, -0.8, -0.4, -0.4, -0.4])
+TREND_SCALE = np.array([0,  2.0,   2.0,   2.0,   5.0,  5.0,  8.0, 10.0, 6.0,  6.0,  3.0,  3.0,  3.0])
+# Drought Season (Jun/Jul) is High Vol
+NOISE_SCALE = np.array([0, 15, 15, 15, 15, 15, 40, 40, 15, 15, 15, 15, 15])
+
+def generate_sim_data(seed=None):
     dates = pd.date_range(start="2023-01-01", end="2023-12-31")
     price = 2600.0
     vol = 300000
     oi = 800000
-    
-    data = []
-    
-    for d in dates:
-        month = d.month
-        
-        # Seasonality Logic (The "Script")
-        trend = 0
-        noise = (np.random.random() - 0.5) * 15
-        
-        if month < 4: trend = (np.random.random() - 0.45) * 2
-        elif month < 6: trend = (np.random.random() - 0.4) * 5 # Planting
-        elif month < 8: # Drought Season (Pump)
-            if month == 7: trend = (np.random.random() + 0.2) * 10
-            else: trend = (np.random.random() - 0.2) * 8
-            noise = (np.random.random() - 0.5) * 40 # High Vol
-        elif month < 10: trend = (np.random.random() - 0.8) * 6 # Harvest Dump
-        else: trend = (np.random.random() - 0.4) * 3
-        
-        price = max(2000, price + trend + noise)
-        
-        # Simulating Rollover Drop in OI
-        if month in [5, 9] and d.day > 10 and d.day < 20:
-            current_oi = oi * 0.1 # Gap in OI during rollover
-        else:
-            current_oi = oi
-            
-        data.append({
-            "date": d,
-            "close": price,
-            "volume": vol * (1 + np.random.random()),
-            "open_interest": current_oi
-        })
-        
-    return pd.DataFrame(data)
+
+    rng = np.random.default_rng(seed)
+    n = len(dates)
+    month = dates.month.to_numpy()
+    day = dates.day.to_numpy()
+
+    trend = (rng.random(n) + TREND_OFFSET[month]) * TREND_SCALE[month]
+    noise = (rng.random(n) - 0.5) * NOISE_SCALE[month]
+
+    # price_t = max(2000, price_{t-1} + step) is a random walk reflected at the floor:
+    # the free walk plus the deepest cumulative breach of the floor so far
+    walk = price + np.cumsum(trend + noise)
+    close = walk + np.maximum(np.maximum.accumulate(2000 - walk), 0)
+
+    # Simulating Rollover Drop in OI (gap during rollover)
+    rollover = np.isin(month, [5, 9]) & (day > 10) & (day < 20)
+
+    return pd.DataFrame({
+        "date": dates,
+        "close": close,
+        "volume": vol * (1 + rng.random(n)),
+        "open_interest": np.where(rollover, oi * 0.1, oi)
+    })
 
 # --- 2. PLATFORM LOGIC REPLICATION (The "QuantMath" Object) ---
 
+@njit(cache=True)
+def _rsi_sma_kernel(p, w):
+    """Single pass: rolling sums of gains/losses over a ring buffer of the last w deltas."""
+    n = p.size
+    out = np.full(n, 50.0)
+    ring_g = np.zeros(w)
+    ring_l = np.zeros(w)
+    sum_g = 0.0
+    sum_l = 0.0
+    # Non-zero counts let an all-zero window read exactly 0 despite running-sum residue
+    nz_g = 0
+    nz_l = 0
+    for i in range(1, n):
+        d = p[i] - p[i - 1]
+        g = d if d > 0 else 0.0
+        l = -d if d < 0 else 0.0
+        k = (i - 1) % w
+        if i > w:
+            sum_g -= ring_g[k]
+            sum_l -= ring_l[k]
+            if ring_g[k] != 0.0: nz_g -= 1
+            if ring_l[k] != 0.0: nz_l -= 1
+        ring_g[k] = g
+        ring_l[k] = l
+        sum_g += g
+        sum_l += l
+        if g != 0.0: nz_g += 1
+        if l != 0.0: nz_l += 1
+        if i >= w:
+            avg_g = max(sum_g, 0.0) / w if nz_g else 0.0
+            avg_l = max(sum_l, 0.0) / w if nz_l else 0.0
+            if avg_l > 0.0:
+                out[i] = 100.0 - 100.0 / (1.0 + avg_g / avg_l)
+            elif avg_g > 0.0:
+                out[i] = 100.0
+    return out
+
+@njit(cache=True)
+def _rsi_wilder_kernel(p, w):
+    """Single pass: Wilder's recursive smoothing (alpha = 1/w), seeded with the first delta."""
+    n = p.size
+    out = np.full(n, np.nan)
+    a = 1.0 / w
+    avg_g = 0.0
+    avg_l = 0.0
+    for i in range(1, n):
+        d = p[i] - p[i - 1]
+        g = d if d > 0 else 0.0
+        l = -d if d < 0 else 0.0
+        if i == 1:
+            avg_g = g
+            avg_l = l
+        else:
+            avg_g = avg_g * (1.0 - a) + g * a
+            avg_l = avg_l * (1.0 - a) + l * a
+        if avg_l > 0.0:
+            out[i] = 100.0 - 100.0 / (1.0 + avg_g / avg_l)
+        elif avg_g > 0.0:
+            out[i] = 100.0
+    return out
+
 def platform_rsi_logic(prices, window=14):
     """
     Replicates the logic found in FeatureEngineering.tsx
     Uses Simple Moving Average (SMA) instead of Wilder's.
+    Warm-up and 0/0 bars read 50 (platform handles nulls gracefully).
     """
-    deltas = prices.diff()
-    gain = deltas.clip(lower=0)
-    loss = -1 * deltas.clip(upper=0)
-    
-    # Platform uses QuantMath.mean (Rolling Mean)
-    avg_gain = gain.rolling(window=window).mean()
-    avg_loss = loss.rolling(window=window).mean()
-    
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi.fillna(50) # Platform handles nulls gracefully
+    return pd.Series(_rsi_sma_kernel(prices.to_numpy(np.float64), window), index=prices.index)
 
 def standard_rsi_logic(prices, window=14):
     """
     Standard Industry RSI (Wilder's Smoothing).
     """
-    deltas = prices.diff()
-    gain = deltas.clip(lower=0)
-    loss = -1 * deltas.clip(upper=0)
-    
-    # Use ewm (Exponential Weighted Function) for Wilder's approximation
-    alpha = 1/window
-    avg_gain = gain.ewm(alpha=alpha, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=alpha, adjust=False).mean()
-    
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+    return pd.Series(_rsi_wilder_kernel(prices.to_numpy(np.float64), window), index=prices.index)
 
 # --- 3. AUDIT EXECUTION ---
 
@@ -11,27 +11,74 @@ QuantAgrify Titan v9.2 Evolutionary Edition (Self-Optimizing Loop)
 """
 
 import os
-import sys
 import time
+import math
 import logging
 import warnings
 import json
+import string
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import getpass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from google.oauth2 import service_account
-from google.cloud import bigquery
-from datetime import datetime, timedelta
+
+# Numba 可选: 缺失时内核退化为普通 Python 函数
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+try:
+    import bottleneck as bn
+    BOTTLENECK_AVAILABLE = True
+except ImportError:
+    BOTTLENECK_AVAILABLE = False
+
+# orjson 可选: 缺失时退回标准库 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # --- 0. 全局配置 ---
 
 KEY_FILENAME = "service_account.json"
 DATASET_ID = "quant_database"
 TABLE_ID = "futures_1min"
-INITIAL_CAPITAL = 10000000.0 
+INITIAL_CAPITAL = 10000000.0
+PLOT_MAX_POINTS = 500
+MA_WINDOWS = (10, 20, 60, 120)  # 供 Agent 切换的均线窗口
+VOL_WINDOW = 60
+SQRT_252 = math.sqrt(252.0)  # 年化因子 (Numba 内核将其作为编译期常量)
+
+# BigQuery 日线聚合查询 (模板哈希参与缓存文件名，模板变更即自动失效)
+# 合约与时间范围走查询参数: SQL 文本对所有资产保持一致，便于 BigQuery 复用结果缓存
+CACHE_DIR = "cache"
+DAILY_AGG_SQL = """
+    SELECT 
+        DATE(timestamp_field_0) as date,
+        ARRAY_AGG(open ORDER BY timestamp_field_0 ASC LIMIT 1)[OFFSET(0)] as open,
+        MAX(high) as high,
+        MIN(low) as low,
+        ARRAY_AGG(close ORDER BY timestamp_field_0 DESC LIMIT 1)[OFFSET(0)] as close,
+        SUM(volume) as volume
+    FROM `{table}`
+    WHERE contract = @symbol
+    AND timestamp_field_0 BETWEEN @start_ts AND @end_ts
+    GROUP BY date
+    ORDER BY date ASC
+"""
+DAILY_AGG_SQL_HASH = hashlib.sha1(DAILY_AGG_SQL.encode()).hexdigest()[:10]
 
 # 19年长周期
 SIM_START_DATE = "2006-01-01"
@@ -44,6 +91,11 @@ ASSETS = {
     'CF9999.XZCE': { 'name': 'Cotton',      'lat': 41.16, 'lon': 80.26,  'leverage': 8 },
 }
 
+# Open-Meteo / Gemini 共用的连接池会话: 复用 TLS 连接，GET 失败时退避重试
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                           max_retries=Retry(total=3, backoff_factor=0.3)))
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - [Titan Evo] %(message)s')
 logger = logging.getLogger("Titan")
 warnings.filterwarnings("ignore")
@@ -51,19 +103,25 @@ warnings.filterwarnings("ignore")
 # --- 1. 数据基础设施 ---
 
 class DataOracle:
-    def __init__(self):
+    def __init__(self, seed=None):
+        # 单一 PCG64 生成器 (替代全局 RandomState)，合成数据可按 seed 复现
+        self.rng = np.random.default_rng(seed)
         self.bq_client = self._init_bq()
         
     def _init_bq(self):
         if os.path.exists(KEY_FILENAME):
             try:
+                # 延迟导入: 合成数据模式下不付出 google-cloud 的冷启动开销
+                from google.oauth2 import service_account
+                from google.cloud import bigquery
                 creds = service_account.Credentials.from_service_account_file(KEY_FILENAME)
                 return bigquery.Client(credentials=creds, project=creds.project_id)
             except Exception:
                 return None
         return None
 
-    def pre_flight_check(self):
+    @staticmethod
+    def pre_flight_check():
         logger.info("🛠️ 执行 API 飞行前检查...")
         # 简单模拟检查，实际应请求 API
         return True
@@ -72,32 +130,58 @@ class DataOracle:
         if not self.bq_client:
             return self._generate_fallback_data(start_date, end_date)
             
-        logger.info(f"📥 BigQuery: 聚合下载 {symbol} ({start_date} -> {end_date})...")
-        query = f"""
-            SELECT 
-                DATE(timestamp_field_0) as date,
-                ARRAY_AGG(open ORDER BY timestamp_field_0 ASC LIMIT 1)[OFFSET(0)] as open,
-                MAX(high) as high,
-                MIN(low) as low,
-                ARRAY_AGG(close ORDER BY timestamp_field_0 DESC LIMIT 1)[OFFSET(0)] as close,
-                SUM(volume) as volume
-            FROM `{self.bq_client.project}.{DATASET_ID}.{TABLE_ID}`
-            WHERE contract = '{symbol}'
-            AND timestamp_field_0 BETWEEN '{start_date}' AND '{end_date}'
-            GROUP BY date
-            ORDER BY date ASC
-        """
+        # 历史日线不可变: 先读本地 Parquet 缓存 (覆盖 start_date 至最后缓存日)，只向 BigQuery 增量拉取尾部
+        cache_path = os.path.join(CACHE_DIR, f"{symbol}_{start_date}_{DAILY_AGG_SQL_HASH}.parquet")
+        cached = None
+        if os.path.exists(cache_path):
+            try:
+                cached = pd.read_parquet(cache_path)
+            except Exception:
+                cached = None
+        if cached is not None and not cached.empty:
+            last_day = cached.index[-1]
+            if last_day >= pd.Timestamp(end_date):
+                return cached.loc[start_date:end_date]
+            # 最后一天可能不完整，从该日起重新拉取并覆盖
+            fetch_start = last_day.strftime('%Y-%m-%d')
+        else:
+            cached = None
+            fetch_start = start_date
+
+        logger.info(f"📥 BigQuery: 聚合下载 {symbol} ({fetch_start} -> {end_date})...")
+        from google.cloud import bigquery
+        query = DAILY_AGG_SQL.format(table=f"{self.bq_client.project}.{DATASET_ID}.{TABLE_ID}")
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter('symbol', 'STRING', symbol),
+            bigquery.ScalarQueryParameter('start_ts', 'TIMESTAMP', pd.Timestamp(fetch_start).to_pydatetime()),
+            bigquery.ScalarQueryParameter('end_ts', 'TIMESTAMP', pd.Timestamp(end_date).to_pydatetime()),
+        ])
         try:
-            df = self.bq_client.query(query).to_dataframe(create_bqstorage_client=False)
+            job = self.bq_client.query(query, job_config=job_config)
+            try:
+                # BigQuery Storage API: 以 Arrow 列式流读取结果，替代 REST 分页
+                df = job.to_dataframe(create_bqstorage_client=True)
+            except Exception as e:
+                # 服务账号缺少 readsessions 权限 (403) 或未安装 storage 客户端时回退 REST
+                logger.warning(f"⚠️ Storage API 不可用，回退 REST: {e}")
+                df = job.to_dataframe(create_bqstorage_client=False)
+            if not df.empty:
+                df['date'] = pd.to_datetime(df['date'])
+                df.set_index('date', inplace=True)
+            if cached is not None:
+                df = pd.concat([cached[cached.index < pd.Timestamp(fetch_start)], df]) if not df.empty else cached
             if df.empty: return self._generate_fallback_data(start_date, end_date)
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
-            return df
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                df.to_parquet(cache_path, compression="zstd")
+            except Exception as e:
+                logger.warning(f"⚠️ Parquet 缓存写入失败: {e}")
+            return df.loc[start_date:end_date]
         except Exception:
+            if cached is not None: return cached.loc[start_date:end_date]
             return self._generate_fallback_data(start_date, end_date)
 
     def fetch_weather_history(self, lat, lon, start_date, end_date):
-        logger.info(f"☁️ Open-Meteo: 获取长周期气象数据...")
         url = "https://archive-api.open-meteo.com/v1/archive"
         params = {
             "latitude": lat, "longitude": lon,
@@ -105,8 +189,18 @@ class DataOracle:
             "daily": ["precipitation_sum", "soil_moisture_0_to_7cm_mean"],
             "timezone": "auto"
         }
+        # 归档气象同样是请求参数的纯函数: 以参数哈希为键缓存到本地 Parquet
+        key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+        cache_path = os.path.join(CACHE_DIR, f"weather_{key}.parquet")
+        if os.path.exists(cache_path):
+            try:
+                return pd.read_parquet(cache_path)
+            except Exception:
+                pass
+
+        logger.info(f"☁️ Open-Meteo: 获取长周期气象数据...")
         try:
-            res = requests.get(url, params=params, timeout=30)
+            res = HTTP_SESSION.get(url, params=params, timeout=30)
             if res.status_code == 200:
                 daily = res.json().get('daily', {})
                 df = pd.DataFrame({
@@ -116,6 +210,11 @@ class DataOracle:
                 })
                 if not df.empty:
                     df.set_index('date', inplace=True)
+                    try:
+                        os.makedirs(CACHE_DIR, exist_ok=True)
+                        df.to_parquet(cache_path, compression="zstd")
+                    except Exception as e:
+                        logger.warning(f"⚠️ Parquet 缓存写入失败: {e}")
                     return df
         except Exception:
             pass
@@ -128,24 +227,123 @@ class DataOracle:
         # 模拟长期牛市+中期震荡
         trend = np.linspace(0, 2, n) # 长期上涨
         cycle = np.sin(np.linspace(0, 20*np.pi, n)) * 0.5 # 周期波动
-        noise = np.random.normal(0, 0.02, n)
+        noise = self.rng.normal(0, 0.02, n)
         price = 3000 * np.exp(trend + cycle + np.cumsum(noise))
         
         df = pd.DataFrame({
             'open': price, 'high': price*1.02, 'low': price*0.98, 'close': price, 
-            'volume': np.random.randint(10000, 100000, n)
+            'volume': self.rng.integers(10000, 100000, n)
         }, index=dates)
         return df
 
 # --- 2. 智能体核心 (Evolutionary RoboTrader v9.2) ---
 
+@njit(cache=True)
+def _rolling_stats(close, daily_ret, windows, vol_window):
+    """
+    单次遍历预计算指标: 每个均线窗口维护滚动和，波动率窗口维护 Welford 均值/平方差和。
+    返回 (len(windows), n) 的均线矩阵与年化波动率；窗口未满或含 NaN 时输出 NaN (同 pandas rolling)。
+    """
+    n = close.size
+    m = windows.size
+    ma = np.full((m, n), np.nan)
+    vol = np.full(n, np.nan)
+    sums = np.zeros(m)
+    nans = np.zeros(m, dtype=np.int64)
+    v_mean = 0.0
+    v_m2 = 0.0
+    v_cnt = 0
+    v_nan = 0
+    for i in range(n):
+        x = close[i]
+        for j in range(m):
+            w = windows[j]
+            if x == x: sums[j] += x
+            else: nans[j] += 1
+            if i >= w:
+                old = close[i - w]
+                if old == old: sums[j] -= old
+                else: nans[j] -= 1
+            if i >= w - 1 and nans[j] == 0:
+                ma[j, i] = sums[j] / w
+
+        r = daily_ret[i]
+        if r == r:
+            v_cnt += 1
+            d = r - v_mean
+            v_mean += d / v_cnt
+            v_m2 += d * (r - v_mean)
+        else:
+            v_nan += 1
+        if i >= vol_window:
+            old = daily_ret[i - vol_window]
+            if old == old:
+                v_cnt -= 1
+                if v_cnt == 0:
+                    v_mean = 0.0
+                    v_m2 = 0.0
+                else:
+                    d = old - v_mean
+                    v_mean -= d / v_cnt
+                    v_m2 -= d * (old - v_mean)
+            else:
+                v_nan -= 1
+        if i >= vol_window - 1 and v_nan == 0:
+            vol[i] = np.sqrt(max(v_m2, 0.0) / (vol_window - 1)) * SQRT_252
+    return ma, vol
+
+@njit(cache=True)
+def _simulate_segment(close, ma_fast, ma_slow, hist_vol, daily_ret, precip, soil,
+                      equity, positions, start, end, position0, target_vol, reversion):
+    """
+    逐日回测内核 (参数在区间内固定，进化只发生在区间之间)。
+    就地写入预分配数组: positions[i] 为第 i 日持仓，equity[i+1] 为第 i 日收盘后权益。
+    气象缺失日以 NaN 表示，比较恒为 False。
+    """
+    eq = equity[start]
+    pos = position0
+    for i in range(start, end):
+        price = close[i]
+
+        # 1. 信号生成 (根据当前 Mode)
+        signal = 0.0
+        if reversion:
+            # 价格远高于均线 -> 做空回归
+            if price > ma_slow[i] * 1.05: signal = -1.0
+            elif price < ma_slow[i] * 0.95: signal = 1.0
+        else:
+            if ma_fast[i] > ma_slow[i]: signal = 1.0
+            elif ma_fast[i] < ma_slow[i]: signal = -1.0
+
+        # 2. 气象修正 (Alpha): 暴雨或极旱 -> 倾向做多(供应担忧)
+        if precip[i] > 20.0 or soil[i] < 0.10:
+            signal += 0.5
+
+        # 3. 仓位计算: 波动率倒数加权 (Risk Parity Core)，杠杆上限 3 倍
+        vol = hist_vol[i]
+        if vol < 0.001: vol = 0.001
+        target_exposure = eq * (target_vol / (vol * SQRT_252))
+        max_exposure = eq * 3.0
+        if max_exposure < target_exposure: target_exposure = max_exposure
+        target_qty = int(target_exposure / price)
+        pos = int(np.sign(signal) * target_qty) if abs(signal) >= 1.0 else 0
+
+        # 4. 结算
+        eq = eq + pos * price * daily_ret[i]
+        positions[i] = pos
+        equity[i + 1] = eq
+
 class RoboTrader:
-    def __init__(self, name, capital):
+    def __init__(self, name, capital, n_days):
         self.name = name
         self.initial_capital = capital
         self.cash = capital
         self.position = 0 
-        self.equity_curve = [capital]
+        # 预分配权益/持仓数组 (回测内核就地写入)，step 为已回测天数
+        self.equity = np.empty(n_days + 1)
+        self.equity[0] = capital
+        self.positions = np.zeros(n_days, dtype=np.int64)
+        self.step = 0
         
         # 动态参数集 (Dynamic Genome)
         # 这些参数会随着回测过程不断“进化”
@@ -160,44 +358,45 @@ class RoboTrader:
         # 记忆与日志
         self.trades = []
         self.decision_log = []
-        self.evolution_log = [] # 记录参数变更历史
+        self.evolution_log = [] # 记录参数变更历史: (日期, 体制, ER, 回撤保护, 旧Vol, 新Vol, 模式) 元组
         
-        # 优化周期计数器
-        self.days_since_opt = 0
+        # 优化周期: 每 opt_interval 个交易日为一个回测区间
         self.opt_interval = 60 # 每60个交易日(约3个月)进行一次反思优化
 
     # --- 兼容性接口 ---
     @property
     def trade_count(self): return len(self.trades)
     @property
-    def optimization_log(self): return self.evolution_log
+    def optimization_log(self): return self.format_evolution_log()
+    @property
+    def equity_curve(self): return self.equity[:self.step + 1]
     # ------------------
 
-    def evolve(self, recent_history):
+    def evolve(self, closes, as_of):
         """
         [核心逻辑] 算法闭环：Cockpit (PnL结果) -> Algorithm (参数调整)
-        基于最近一段的历史表现，调整下一阶段的策略参数。
+        基于最近一段的历史表现 (收盘价数组视图，截至 as_of)，调整下一阶段的策略参数。
         """
-        if len(recent_history) < 60: return
+        if len(closes) < 60: return
 
         # 1. 计算近期绩效
-        closes = recent_history['close'].values
-        returns = pd.Series(closes).pct_change().dropna()
+        diffs = np.diff(closes)
+        returns = closes[1:] / closes[:-1] - 1  # 视图相除，免去 Series/shift/dropna 拷贝
         
         recent_ret = (closes[-1] / closes[0]) - 1
-        recent_vol = returns.std() * np.sqrt(252)
+        recent_vol = returns.std(ddof=1) * SQRT_252
         
         # 简单夏普比率估算
         sharpe = (recent_ret / recent_vol) if recent_vol > 0 else 0
         
-        old_params = self.params.copy()
-        change_reason = ""
+        old_vol = self.params['target_vol']
+        regime = None
 
         # 2. 体制识别 (Regime Detection)
         # 使用 ADX 或简单的 趋势效率系数 (Efficiency Ratio)
         # ER = Abs(Total Change) / Sum(Abs(Daily Changes))
         total_change = abs(closes[-1] - closes[0])
-        sum_daily_change = np.sum(np.abs(np.diff(closes)))
+        sum_daily_change = np.sum(np.abs(diffs))
         er = total_change / sum_daily_change if sum_daily_change > 0 else 0
         
         # 3. 进化逻辑 (Evolution Logic)
@@ -207,105 +406,86 @@ class RoboTrader:
             self.params['mode'] = 'TREND'
             self.params['ma_fast'] = 10  # 加快反应
             self.params['target_vol'] = min(0.25, self.params['target_vol'] * 1.2) # 敢于赢
-            change_reason = f"识别到强趋势 (ER={er:.2f}) -> 激进模式"
+            regime = 'TREND'
             
         # 场景 B: 震荡市 (ER < 0.15) -> 切换为均值回归，降低仓位
         elif er < 0.15:
             self.params['mode'] = 'REVERSION'
             self.params['target_vol'] = max(0.05, self.params['target_vol'] * 0.8) # 苟住
-            change_reason = f"市场陷入震荡 (ER={er:.2f}) -> 防御模式"
+            regime = 'REVERSION'
             
         # 场景 C: 剧烈亏损 (Sharpe < -1) -> 紧急风控
-        if sharpe < -1.0:
+        drawdown = sharpe < -1.0
+        if drawdown:
             self.params['target_vol'] = 0.05 # 极低仓位
             self.params['stop_loss_atr'] = 1.0 # 收紧止损
-            change_reason += " | 触发回撤保护"
-
-        # 记录进化
-        if change_reason:
-            log_entry = f"[{recent_history.index[-1].date()}] {change_reason} | Vol:{old_params['target_vol']:.2f}->{self.params['target_vol']:.2f} | Mode:{self.params['mode']}"
-            self.evolution_log.append(log_entry)
-            # logger.info(f"🧬 {log_entry}")
-
-    def calculate_position_target(self, price, volatility):
-        # 波动率倒数加权 (Risk Parity Core)
-        if volatility < 0.001: volatility = 0.001
-        
-        # 目标名义本金 = 账户权益 * (目标波动率 / 当前波动率)
-        target_exposure = self.equity_curve[-1] * (self.params['target_vol'] / (volatility * np.sqrt(252)))
-        
-        # 杠杆限制 (最大 3倍)
-        max_exposure = self.equity_curve[-1] * 3.0
-        target_exposure = min(target_exposure, max_exposure)
-        
-        return int(target_exposure / price)
 
-    def process_day(self, date, market_data, weather_data):
-        close_price = market_data['close']
-        
-        # 1. 动态指标计算 (基于当前进化后的参数)
-        # 注意：这里简化处理，实际应基于 historical buffer 计算
-        # 我们假设 market_data 包含必要历史切片，但在逐日循环中这很难。
-        # 变通方案：我们在外部预计算了大量指标，这里只取值，或者在这里做轻量级计算。
-        # 为了演示进化效果，我们用简单逻辑模拟：
-        
-        ma_fast = market_data.get(f"ma_{self.params['ma_fast']}", close_price)
-        ma_slow = market_data.get(f"ma_{self.params['ma_slow']}", close_price)
-        hist_vol = market_data.get('hist_vol', 0.02)
-
-        # 2. 信号生成 (根据当前 Mode)
-        signal = 0
-        if self.params['mode'] == 'TREND':
-            if ma_fast > ma_slow: signal = 1
-            elif ma_fast < ma_slow: signal = -1
-        else: # REVERSION
-            # 价格远高于均线 -> 做空回归
-            if close_price > ma_slow * 1.05: signal = -1
-            elif close_price < ma_slow * 0.95: signal = 1
-
-        # 3. 气象修正 (Alpha)
-        weather_desc = "Normal"
-        if weather_data:
-            precip = weather_data.get('precip', 0)
-            if precip > 20.0: # 暴雨
-                signal += 0.5 # 倾向做多(供应担忧)
-                weather_desc = f"HeavyRain({precip:.0f})"
-            elif weather_data.get('soil_moisture', 50) < 0.10: # 极旱
-                signal += 0.5
-                weather_desc = "Drought"
-
-        # 4. 仓位计算
-        target_qty = self.calculate_position_target(close_price, hist_vol)
-        final_pos = int(np.sign(signal) * target_qty) if abs(signal) >= 1 else 0
-        
-        # 5. 执行
-        if self.position != final_pos:
-            trade_qty = final_pos - self.position
-            if trade_qty != 0:
-                action = "BUY" if trade_qty > 0 else "SELL"
-                self.trades.append({
-                    'date': date, 'action': action, 'price': close_price, 
-                    'qty': abs(trade_qty), 'reason': f"{self.params['mode']} | {weather_desc}"
-                })
-                # 记录重要决策
-                if abs(trade_qty) * close_price > self.equity_curve[-1] * 0.5:
-                    self.decision_log.append(f"[{date.date()}] {action} {abs(trade_qty)} | {self.params['mode']} Strategy | {weather_desc}")
-            self.position = final_pos
-
-        # 6. 结算
-        daily_ret = market_data.get('daily_ret', 0)
-        pnl = self.position * close_price * daily_ret
-        self.equity_curve.append(self.equity_curve[-1] + pnl)
-        
-        # 7. 触发进化检查
-        self.days_since_opt += 1
-        if self.days_since_opt >= self.opt_interval:
-            self.days_since_opt = 0
-            return True # 需要外部调用 evolve
-        return False
+        # 记录进化 (仅存结构化元组，文本在出报告时再渲染)
+        if regime or drawdown:
+            self.evolution_log.append((as_of, regime, er, drawdown, old_vol, self.params['target_vol'], self.params['mode']))
+
+    def format_evolution_log(self, entries=None):
+        """按需把进化日志元组渲染为可读文本 (报告/AI上下文使用)，entries 缺省为全部"""
+        lines = []
+        for as_of, regime, er, drawdown, old_vol, new_vol, mode in (self.evolution_log if entries is None else entries):
+            if regime == 'TREND':
+                reason = f"识别到强趋势 (ER={er:.2f}) -> 激进模式"
+            elif regime == 'REVERSION':
+                reason = f"市场陷入震荡 (ER={er:.2f}) -> 防御模式"
+            else:
+                reason = ""
+            if drawdown:
+                reason += " | 触发回撤保护"
+            lines.append(f"[{as_of.date()}] {reason} | Vol:{old_vol:.2f}->{new_vol:.2f} | Mode:{mode}")
+        return lines
+
+    def run_segment(self, dates, cols, start, end):
+        """
+        回测 [start, end) 区间：逐日数值计算交给 _simulate_segment (Numba)，
+        Python 侧只负责按持仓变化补记交易与决策日志。
+        """
+        p = self.params
+        _simulate_segment(
+            cols['close'], cols[f"ma_{p['ma_fast']}"], cols[f"ma_{p['ma_slow']}"],
+            cols['hist_vol'], cols['daily_ret'], cols['precip'], cols['soil_moisture'],
+            self.equity, self.positions, start, end, self.position,
+            p['target_vol'], p['mode'] == 'REVERSION'
+        )
+        if end <= start: return
+
+        positions = self.positions[start:end]
+        prev_pos = np.concatenate(([self.position], positions[:-1]))
+        prev_eq = self.equity[start:end]  # 交易前 (前一日收盘) 权益
+        for k in np.flatnonzero(positions != prev_pos):
+            i = start + k
+            date, price = dates[i], cols['close'][i]
+            trade_qty = int(positions[k] - prev_pos[k])
+            action = "BUY" if trade_qty > 0 else "SELL"
+            precip = cols['precip'][i]
+            if precip > 20.0: weather_desc = f"HeavyRain({precip:.0f})"
+            elif cols['soil_moisture'][i] < 0.10: weather_desc = "Drought"
+            else: weather_desc = "Normal"
+            self.trades.append({
+                'date': date, 'action': action, 'price': price,
+                'qty': abs(trade_qty), 'reason': f"{p['mode']} | {weather_desc}"
+            })
+            # 记录重要决策
+            if abs(trade_qty) * price > prev_eq[k] * 0.5:
+                self.decision_log.append(f"[{date.date()}] {action} {abs(trade_qty)} | {p['mode']} Strategy | {weather_desc}")
+
+        self.position = int(positions[-1])
+        self.step = end
 
 # --- 4. 分析报告模块 ---
 
+def _json_bytes(obj, pretty=False):
+    """序列化为 UTF-8 JSON 字节串 (优先 orjson，中文不转义)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 def call_gemini_analysis(api_key, context_data, asset_name):
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
     headers = {'Content-Type': 'application/json'}
@@ -331,42 +511,37 @@ def call_gemini_analysis(api_key, context_data, asset_name):
     
     payload = {"contents": [{"parts": [{"text": prompt}]}]}
     try:
-        res = requests.post(url, headers=headers, json=payload, timeout=60)
+        res = HTTP_SESSION.post(url, headers=headers, data=_json_bytes(payload), timeout=60)
         if res.status_code == 200:
             return res.json()['candidates'][0]['content']['parts'][0]['text']
         return f"<p style='color:red'>AI 分析失败: {res.text}</p>"
     except Exception as e:
         return f"<p>API Error: {e}</p>"
 
-def generate_html_report(asset_name, agent, metrics, ai_content, plot_div):
-    # 计算年化收益
-    years = 19
-    total_ret = metrics['ret'] / 100
-    cagr = ((1 + total_ret) ** (1/years)) - 1
-    
-    html = f"""
+# 报告模板只在模块加载时解析一次，每份报告仅做 substitute
+_REPORT_HEAD = string.Template("""
     <!DOCTYPE html>
     <html>
     <head>
-        <title>Titan v9.2 Evolutionary Report - {asset_name}</title>
+        <title>Titan v9.2 Evolutionary Report - $asset</title>
         <style>
-            body {{ background: #0a0c10; color: #e2e8f0; font-family: 'Segoe UI', sans-serif; padding: 30px; }}
-            .header {{ display: flex; justify-content: space-between; border-bottom: 2px solid #30363d; padding-bottom: 20px; margin-bottom: 30px; }}
-            .card {{ background: #161b22; border: 1px solid #30363d; border-radius: 12px; padding: 25px; margin-bottom: 25px; }}
-            h1 {{ margin: 0; color: #58a6ff; }}
-            .badge {{ background: #238636; color: white; padding: 5px 10px; border-radius: 20px; font-size: 12px; font-weight: bold; }}
-            .stat-grid {{ display: grid; grid-template-columns: repeat(4, 1fr); gap: 20px; }}
-            .stat-box {{ text-align: center; }}
-            .stat-val {{ font-size: 24px; font-weight: bold; color: #e2e8f0; }}
-            .stat-label {{ font-size: 12px; color: #8b949e; text-transform: uppercase; }}
-            .log-box {{ height: 200px; overflow-y: scroll; background: #0d1117; padding: 15px; border-radius: 8px; font-family: monospace; font-size: 11px; color: #7ee787; border: 1px solid #30363d; }}
+            body { background: #0a0c10; color: #e2e8f0; font-family: 'Segoe UI', sans-serif; padding: 30px; }
+            .header { display: flex; justify-content: space-between; border-bottom: 2px solid #30363d; padding-bottom: 20px; margin-bottom: 30px; }
+            .card { background: #161b22; border: 1px solid #30363d; border-radius: 12px; padding: 25px; margin-bottom: 25px; }
+            h1 { margin: 0; color: #58a6ff; }
+            .badge { background: #238636; color: white; padding: 5px 10px; border-radius: 20px; font-size: 12px; font-weight: bold; }
+            .stat-grid { display: grid; grid-template-columns: repeat(4, 1fr); gap: 20px; }
+            .stat-box { text-align: center; }
+            .stat-val { font-size: 24px; font-weight: bold; color: #e2e8f0; }
+            .stat-label { font-size: 12px; color: #8b949e; text-transform: uppercase; }
+            .log-box { height: 200px; overflow-y: scroll; background: #0d1117; padding: 15px; border-radius: 8px; font-family: monospace; font-size: 11px; color: #7ee787; border: 1px solid #30363d; }
         </style>
         <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
     </head>
     <body>
         <div class="header">
             <div>
-                <h1>{asset_name} 进化策略报告</h1>
+                <h1>$asset 进化策略报告</h1>
                 <p style="color:#8b949e; margin:5px 0 0 0;">Titan v9.2 Evolutionary Engine | 2006-2024 (19 Years)</p>
             </div>
             <div><span class="badge">TARGET ACHIEVED: CAGR > 5%</span></div>
@@ -375,19 +550,19 @@ def generate_html_report(asset_name, agent, metrics, ai_content, plot_div):
         <div class="card">
             <div class="stat-grid">
                 <div class="stat-box">
-                    <div class="stat-val" style="color:#238636">{metrics['ret']}%</div>
+                    <div class="stat-val" style="color:#238636">$ret</div>
                     <div class="stat-label">总收益率</div>
                 </div>
                 <div class="stat-box">
-                    <div class="stat-val" style="color:#58a6ff">{cagr*100:.2f}%</div>
+                    <div class="stat-val" style="color:#58a6ff">$cagr</div>
                     <div class="stat-label">年化复合收益 (CAGR)</div>
                 </div>
                 <div class="stat-box">
-                    <div class="stat-val">{agent.trade_count}</div>
+                    <div class="stat-val">$trades</div>
                     <div class="stat-label">交易次数</div>
                 </div>
                 <div class="stat-box">
-                    <div class="stat-val">{len(agent.optimization_log)}</div>
+                    <div class="stat-val">$evolutions</div>
                     <div class="stat-label">自我进化次数</div>
                 </div>
             </div>
@@ -395,29 +570,136 @@ def generate_html_report(asset_name, agent, metrics, ai_content, plot_div):
 
         <div class="card">
             <h3 style="color:#58a6ff">🧠 Gemini 策略归因分析</h3>
-            <div style="line-height:1.6; color:#c9d1d9;">{ai_content}</div>
+            <div style="line-height:1.6; color:#c9d1d9;">$ai</div>
         </div>
 
         <div class="card">
-            {plot_div}
+    """)
+
+_REPORT_TAIL = string.Template("""
         </div>
         
         <div class="card">
             <h3 style="color:#7ee787">🧬 策略进化日志 (Evolution Log)</h3>
             <div class="log-box">
-                {'<br>'.join(agent.optimization_log)}
+                $log
             </div>
         </div>
     </body>
     </html>
-    """
-    filename = f"Titan_v9_Evo_{asset_name.split()[0]}_{int(time.time())}.html"
+    """)
+
+def generate_html_report(asset_name, agent, metrics, ai_content, fig):
+    # 计算年化收益
+    years = 19
+    total_ret = metrics['ret'] / 100
+    cagr = ((1 + total_ret) ** (1/years)) - 1
+    
+    head = _REPORT_HEAD.substitute(
+        asset=asset_name, ret=f"{metrics['ret']}%", cagr=f"{cagr*100:.2f}%",
+        trades=agent.trade_count, evolutions=len(agent.evolution_log), ai=ai_content,
+    )
+    tail = _REPORT_TAIL.substitute(log='<br>'.join(agent.optimization_log))
+    # 报告在循环结束后连续写出，文件名需区分同前缀资产 (Soybean No.1 / Soybean Meal)
+    filename = f"Titan_v9_Evo_{asset_name.replace(' ', '_').replace('.', '')}_{int(time.time())}.html"
+    # 图表直接流式写入文件，避免 head + 图表 JSON + tail 拼成一个大字符串
     with open(filename, "w", encoding='utf-8') as f:
-        f.write(html)
+        f.write(head)
+        fig.write_html(f, full_html=False, include_plotlyjs=False)
+        f.write(tail)
     print(f"📄 报告已生成: {os.path.abspath(filename)}")
 
 # --- 5. 主程序 ---
 
+def run_asset_backtest(symbol, meta):
+    """单资产完整流水线 (数据 -> 指标 -> 分段回测 -> 图表)，各资产相互独立，在子进程中运行。"""
+    print(f"\n🚀 启动进化仿真: {meta['name']} ...")
+
+    # 1. 获取数据 (每个进程独立创建 BigQuery 客户端)
+    oracle = DataOracle()
+    df_daily = oracle.fetch_futures_daily_aggregated(symbol, SIM_START_DATE, SIM_END_DATE)
+    df_weather = oracle.fetch_weather_history(meta['lat'], meta['lon'], SIM_START_DATE, SIM_END_DATE)
+
+    # 2. 预计算技术指标 (Pre-compute potential factors for the Agent to choose from)
+    df_daily['daily_ret'] = df_daily['close'].pct_change().fillna(0)
+    # 计算多种均线供 Agent 切换: Numba 单次遍历同时产出全部窗口；
+    # 无 Numba 时回退 bottleneck 的 C 滑窗内核，再退至 pandas rolling
+    if NUMBA_AVAILABLE:
+        ma, hist_vol = _rolling_stats(df_daily['close'].to_numpy(dtype=np.float64),
+                                      df_daily['daily_ret'].to_numpy(dtype=np.float64),
+                                      np.array(MA_WINDOWS), VOL_WINDOW)
+        for j, w in enumerate(MA_WINDOWS):
+            df_daily[f'ma_{w}'] = ma[j]
+        df_daily['hist_vol'] = hist_vol
+    elif BOTTLENECK_AVAILABLE:
+        closes = df_daily['close'].to_numpy(dtype=np.float64)
+        for w in MA_WINDOWS:
+            df_daily[f'ma_{w}'] = bn.move_mean(closes, w)
+        df_daily['hist_vol'] = bn.move_std(df_daily['daily_ret'].to_numpy(dtype=np.float64), VOL_WINDOW, ddof=1) * SQRT_252
+    else:
+        for w in MA_WINDOWS:
+            df_daily[f'ma_{w}'] = df_daily['close'].rolling(w).mean()
+        df_daily['hist_vol'] = df_daily['daily_ret'].rolling(VOL_WINDOW).std() * SQRT_252
+    df_daily.dropna(inplace=True)
+
+    # 3. 初始化进化机器人
+    robot = RoboTrader(f"Titan-{symbol}", INITIAL_CAPITAL, len(df_daily))
+
+    print(f"   ⏳ 正在回测 {len(df_daily)} 个交易日 (Self-Optimizing)...")
+
+    # 4. 分段仿真: 列一次性转为 NumPy (气象按交易日对齐，缺失为 NaN)，
+    #    每 opt_interval 天的检查点 (前 250 天除外) 回到 Python 进化参数
+    n = len(df_daily)
+    dates = df_daily.index
+    cols = {c: df_daily[c].to_numpy(dtype=np.float64) for c in df_daily.columns}
+    for c in ('precip', 'soil_moisture'):
+        cols[c] = (df_weather[c].reindex(dates).to_numpy(dtype=np.float64)
+                   if c in df_weather.columns else np.full(n, np.nan))
+    checkpoints = [i for i in range(robot.opt_interval - 1, n, robot.opt_interval) if i > 250]
+
+    start = 0
+    for cp in checkpoints + [None]:
+        stop = n if cp is None else cp + 1
+        robot.run_segment(dates, cols, start, stop)
+        for i in range(-(-start // 500) * 500, stop, 500):
+            eq = robot.equity[i + 1]
+            ret = (eq - INITIAL_CAPITAL) / INITIAL_CAPITAL * 100
+            print(f"      -> {dates[i].date()} | Equity: {eq:,.0f} ({ret:+.1f}%) | Mode: {robot.params['mode']}")
+        if cp is not None:
+            # 触发进化循环 (Loop Back to Algorithm): 传入过去半年收盘价的零拷贝视图进行反思
+            robot.evolve(cols['close'][cp-120:cp], dates[cp-1])
+        start = stop
+
+    # 5. 结果
+    final_eq = robot.equity_curve[-1]
+    ret = (final_eq - INITIAL_CAPITAL) / INITIAL_CAPITAL * 100
+    print(f"   💰 最终权益: {final_eq:,.0f} (总收益: {ret:.2f}%)")
+
+    # 6. 图表 (仅用于展示: float32 + 降采样至 ~500 点, 减小 Plotly JSON 体积)
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    step = max(1, len(df_daily) // PLOT_MAX_POINTS)
+    plot_dates = df_daily.index[::step]
+    plot_equity = np.asarray(robot.equity_curve[1:], dtype=np.float32)[::step]
+    plot_close = df_daily['close'].to_numpy(dtype=np.float32)[::step]
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Scatter(x=plot_dates, y=plot_equity, name="Evo-Strategy", line=dict(color='#238636', width=2)), secondary_y=False)
+    fig.add_trace(go.Scatter(x=plot_dates, y=plot_close, name="Benchmark", line=dict(color='#8b949e', width=1, dash='dot')), secondary_y=True)
+    fig.update_layout(title=f"Titan v9.2 Evolutionary Performance: {meta['name']}", template="plotly_dark", height=500)
+
+    # 7. 交给主进程的 Gemini 上下文与报告指标
+    context = f"""
+    资产: {meta['name']}
+    初始资金: {INITIAL_CAPITAL} -> 最终: {final_eq}
+    总收益率: {ret:.2f}%
+    进化次数: {len(robot.evolution_log)}
+
+    进化日志样本 (前5条 + 后5条):
+    {_json_bytes(robot.format_evolution_log(robot.evolution_log[:5] + robot.evolution_log[-5:]), pretty=True).decode('utf-8')}
+    """
+    metrics = {"ret": round(ret, 2), "final_equity": f"{final_eq:,.0f}"}
+    return meta['name'], robot, metrics, context, fig
+
 def run_simulation():
     print("\n" + "="*60)
     print("🌾 QuantAgrify Titan v9.2 Evolutionary Edition")
@@ -426,73 +708,24 @@ def run_simulation():
     print("="*60 + "\n")
     
     gemini_key = getpass.getpass("🔑 Gemini API Key: ")
-    oracle = DataOracle()
-    oracle.pre_flight_check()
+    ai_pool = ThreadPoolExecutor(max_workers=len(ASSETS))
+    pending_reports = []
+    DataOracle.pre_flight_check()
     
-    for symbol, meta in ASSETS.items():
-        print(f"\n🚀 启动进化仿真: {meta['name']} ...")
-        
-        # 1. 获取数据
-        df_daily = oracle.fetch_futures_daily_aggregated(symbol, SIM_START_DATE, SIM_END_DATE)
-        df_weather = oracle.fetch_weather_history(meta['lat'], meta['lon'], SIM_START_DATE, SIM_END_DATE)
-        
-        # 2. 预计算技术指标 (Pre-compute potential factors for the Agent to choose from)
-        df_daily['daily_ret'] = df_daily['close'].pct_change().fillna(0)
-        # 计算多种均线供 Agent 切换
-        for w in [10, 20, 60, 120]:
-            df_daily[f'ma_{w}'] = df_daily['close'].rolling(w).mean()
-        df_daily['hist_vol'] = df_daily['daily_ret'].rolling(60).std() * np.sqrt(252)
-        df_daily.dropna(inplace=True)
-        
-        # 3. 初始化进化机器人
-        robot = RoboTrader(f"Titan-{symbol}", INITIAL_CAPITAL)
-        
-        print(f"   ⏳ 正在回测 {len(df_daily)} 个交易日 (Self-Optimizing)...")
-        
-        # 4. 逐日仿真
-        for i, (date, row) in enumerate(df_daily.iterrows()):
-            w_today = df_weather.loc[date].to_dict() if date in df_weather.index else None
-            
-            # 执行交易逻辑
-            need_optimization = robot.process_day(date, row, w_today)
-            
-            # 触发进化循环 (Loop Back to Algorithm)
-            if need_optimization and i > 250:
-                # 传入过去半年的数据进行反思
-                lookback_data = df_daily.iloc[i-120:i]
-                robot.evolve(lookback_data)
-            
-            if i % 500 == 0:
-                eq = robot.equity_curve[-1]
-                ret = (eq - INITIAL_CAPITAL) / INITIAL_CAPITAL * 100
-                print(f"      -> {date.date()} | Equity: {eq:,.0f} ({ret:+.1f}%) | Mode: {robot.params['mode']}")
-
-        # 5. 结果
-        final_eq = robot.equity_curve[-1]
-        ret = (final_eq - INITIAL_CAPITAL) / INITIAL_CAPITAL * 100
-        print(f"   💰 最终权益: {final_eq:,.0f} (总收益: {ret:.2f}%)")
-        
-        # 6. 图表与报告
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
-        fig.add_trace(go.Scatter(x=df_daily.index, y=robot.equity_curve[1:], name="Evo-Strategy", line=dict(color='#238636', width=2)), secondary_y=False)
-        fig.add_trace(go.Scatter(x=df_daily.index, y=df_daily['close'], name="Benchmark", line=dict(color='#8b949e', width=1, dash='dot')), secondary_y=True)
-        fig.update_layout(title=f"Titan v9.2 Evolutionary Performance: {meta['name']}", template="plotly_dark", height=500)
-        plot_div = fig.to_html(full_html=False, include_plotlyjs=False)
-        
-        if gemini_key:
-            print("   🧠 Gemini 正在分析进化日志...")
-            context = f"""
-            资产: {meta['name']}
-            初始资金: {INITIAL_CAPITAL} -> 最终: {final_eq}
-            总收益率: {ret:.2f}%
-            进化次数: {len(robot.optimization_log)}
-            
-            进化日志样本 (前5条 + 后5条):
-            {json.dumps(robot.optimization_log[:5] + robot.optimization_log[-5:], ensure_ascii=False, indent=1)}
-            """
-            ai_text = call_gemini_analysis(gemini_key, context, meta['name'])
-            metrics = {"ret": round(ret, 2), "final_equity": f"{final_eq:,.0f}"}
-            generate_html_report(meta['name'], robot, metrics, ai_text, plot_div)
+    # 各资产在独立进程中并行回测；先完成者先把 Gemini 请求交给后台线程
+    with ProcessPoolExecutor(max_workers=len(ASSETS)) as pool:
+        futures = [pool.submit(run_asset_backtest, symbol, meta) for symbol, meta in ASSETS.items()]
+        for fut in as_completed(futures):
+            asset_name, robot, metrics, context, fig = fut.result()
+            if gemini_key:
+                print(f"   🧠 Gemini 正在分析 {asset_name} 进化日志 (后台)...")
+                ai_future = ai_pool.submit(call_gemini_analysis, gemini_key, context, asset_name)
+                pending_reports.append((asset_name, robot, metrics, ai_future, fig))
+
+    # 8. 所有资产回测结束后再收取 AI 结果并写报告
+    for asset_name, robot, metrics, ai_future, fig in pending_reports:
+        generate_html_report(asset_name, robot, metrics, ai_future.result(), fig)
+    ai_pool.shutdown()
 
 if __name__ == "__main__":
     run_simulation()
@@ -3,92 +3,178 @@ import numpy as np
 import pandas as pd
 import math
 
+# Numba is optional: without it the kernels below run as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+# SciPy is optional: its compiled IIR filter backs the RSI when Numba is missing
+try:
+    from scipy.signal import lfilter
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
 # --- PART 1: THE SIMULATOR (GENERATING THE EXAM) ---
 
-def generate_scenario(scenario_type):
+def _regime_flat(dates, doy, n):
+    """Baseline regime vectors (one value per bar): no trend, normal noise, no shock, no gap."""
+    return {
+        "trend_factor": np.zeros(n),
+        "noise_std": np.full(n, 10.0),
+        "volume_mult": np.ones(n),
+        "shock_active": np.zeros(n, dtype=bool),
+        "gap": np.zeros(n),
+    }
+
+def _regime_bull_shock(dates, doy, n):
+    # Context: Soybean Meal Drought (Summer Spike)
+    r = _regime_flat(dates, doy, n)
+    shock_active = (doy >= 150) & (doy <= 240) # June - Aug (Growing Season)
+    # Compounding daily gain (+0.005/day) in season, cooling off (-0.002/day, floored at 0) outside.
+    # The floored running sum is the reflected walk S - min(0, running min of S).
+    steps = np.where(shock_active, 0.005, -0.002)
+    walk = np.cumsum(steps)
+    r["shock_active"] = shock_active
+    r["trend_factor"] = walk - np.minimum(np.minimum.accumulate(walk), 0)
+    r["noise_std"] = np.where(shock_active, 25.0, 10.0) # High Volatility in season
+    r["volume_mult"] = np.where(shock_active, 2.5, 1.0)
+    return r
+
+def _regime_bear_harvest(dates, doy, n):
+    # Context: Corn Harvest Pressure (Autumn Dump)
+    r = _regime_flat(dates, doy, n)
+    harvest = (doy >= 270) & (doy <= 330) # Oct - Nov (Harvest)
+    r["trend_factor"] = np.where(harvest, -0.003, 0.0) # Steady grind down
+    r["noise_std"] = np.where(harvest, 8.0, 10.0) # Low Volatility (Bleed)
+    volume_mult = np.where(harvest, 0.8, 1.0)
+    # Panic selling at the very bottom
+    volume_mult[harvest & (doy > 320)] = 3.0
+    r["volume_mult"] = volume_mult
+    return r
+
+def _regime_rollover_gap(dates, doy, n):
+    # Context: Palm Oil Contract Switch (Gap Test)
+    r = _regime_flat(dates, doy, n)
+    r["trend_factor"] = np.sin(np.arange(n) / 10) * 0.001 # Choppy
+    r["noise_std"] = np.full(n, 12.0)
+    # THE GAP EVENT (May 15th): Huge 200 point gap up (Contango) on rollover volume
+    gap_day = (dates.month == 5) & (dates.day == 15)
+    r["gap"][gap_day] = 200.0
+    r["volume_mult"][gap_day] = 5.0
+    return r
+
+# Scenario dispatch: the regime builder is picked once per call, never per bar
+_SCENARIOS = {
+    'A_BULL_SHOCK': _regime_bull_shock,
+    'B_BEAR_HARVEST': _regime_bear_harvest,
+    'C_ROLLOVER_GAP': _regime_rollover_gap,
+}
+
+def generate_scenario(scenario_type, seed=None):
     dates = pd.date_range(start="2023-01-01", end="2023-12-31", freq='B') # Business days
     n = len(dates)
+    rng = np.random.default_rng(seed)
+    doy = dates.dayofyear.to_numpy()
     
     # Base Parameters
-    price = 3000.0
+    price0 = 3000.0
     vol_base = 100000
     oi_base = 500000
     
-    data = []
+    # --- SCENARIO LOGIC ---
+    regime = _SCENARIOS.get(scenario_type, _regime_flat)(dates, doy, n)
+    trend_factor = regime["trend_factor"]
+    noise_std = regime["noise_std"]
+    volume_mult = regime["volume_mult"]
+    shock_active = regime["shock_active"]
+    gap = regime["gap"]
     
-    # State Memory
-    trend_factor = 0
-    shock_active = False
+    # Apply Dynamics: price[t] = (price[t-1] + gap[t]) * (1 + trend[t]) + noise[t].
+    # Solved in closed form with the cumulative growth factor G: price[t] = G[t] * (price0 + sum(b / G)).
+    noise = rng.normal(0.0, noise_std)
+    growth = 1 + trend_factor
+    G = np.cumprod(growth)
+    price = G * (price0 + np.cumsum((gap * growth + noise) / G))
+    current_vol = vol_base * volume_mult * (1 + rng.random(n))
+    current_oi = oi_base * np.where(shock_active, 1.2, 0.9)
     
-    for i, d in enumerate(dates):
-        month = d.month
-        day_of_year = d.dayofyear
-        
-        # --- SCENARIO LOGIC ---
-        
-        if scenario_type == 'A_BULL_SHOCK': 
-            # Context: Soybean Meal Drought (Summer Spike)
-            if 150 <= day_of_year <= 240: # June - Aug (Growing Season)
-                shock_active = True
-                trend_factor += 0.005 # Compounding daily gain (Exponential)
-                noise = np.random.normal(0, 25) # High Volatility
-                volume_mult = 2.5
-            else:
-                shock_active = False
-                trend_factor = max(0, trend_factor - 0.002) # Cooling off
-                noise = np.random.normal(0, 10)
-                volume_mult = 1.0
-                
-        elif scenario_type == 'B_BEAR_HARVEST':
-            # Context: Corn Harvest Pressure (Autumn Dump)
-            if 270 <= day_of_year <= 330: # Oct - Nov (Harvest)
-                trend_factor = -0.003 # Steady grind down
-                noise = np.random.normal(0, 8) # Low Volatility (Bleed)
-                volume_mult = 0.8
-                # Panic selling at the very bottom
-                if day_of_year > 320: volume_mult = 3.0 
-            else:
-                trend_factor = 0
-                noise = np.random.normal(0, 10)
-                volume_mult = 1.0
-                
-        elif scenario_type == 'C_ROLLOVER_GAP':
-            # Context: Palm Oil Contract Switch (Gap Test)
-            trend_factor = np.sin(i / 10) * 0.001 # Choppy
-            noise = np.random.normal(0, 12)
-            volume_mult = 1.0
-            
-            # THE GAP EVENT (May 15th)
-            if d.month == 5 and d.day == 15:
-                price += 200 # Huge 200 point gap up (Contango)
-                volume_mult = 5.0 # Rollover volume
-        
-        # Apply Dynamics
-        price = price * (1 + trend_factor) + noise
-        current_vol = vol_base * volume_mult * (1 + np.random.random())
-        current_oi = oi_base * (1.2 if shock_active else 0.9)
-        
-        # OHLC Construction
-        daily_range = price * 0.02 if shock_active else price * 0.01
-        close = price
-        open_p = close + np.random.normal(0, daily_range/2)
-        high = max(open_p, close) + abs(np.random.normal(0, daily_range/2))
-        low = min(open_p, close) - abs(np.random.normal(0, daily_range/2))
-        
-        data.append({
-            "date": d,
-            "open": round(open_p, 2),
-            "high": round(high, 2),
-            "low": round(low, 2),
-            "close": round(close, 2),
-            "volume": int(current_vol),
-            "open_interest": int(current_oi)
-        })
-        
-    return pd.DataFrame(data)
+    # OHLC Construction
+    # One batched draw for the open / high / low offsets, scaled by half the daily range
+    half_range = price * np.where(shock_active, 0.02, 0.01) / 2
+    z = rng.standard_normal((n, 3))
+    close = price
+    open_p = close + z[:, 0] * half_range
+    high = np.maximum(open_p, close) + np.abs(z[:, 1]) * half_range
+    low = np.minimum(open_p, close) - np.abs(z[:, 2]) * half_range
+    
+    return pd.DataFrame({
+        "date": dates,
+        "open": np.round(open_p, 2),
+        "high": np.round(high, 2),
+        "low": np.round(low, 2),
+        "close": np.round(close, 2),
+        "volume": current_vol.astype(np.int64),
+        "open_interest": current_oi.astype(np.int64)
+    })
 
 # --- PART 2: THE DIGITAL TWIN (QUANTAGRIFY LOGIC REPLICATION) ---
 
+@njit(cache=True)
+def _rsi_wilder_kernel(p, w):
+    """Single pass: Wilder's recursive smoothing (alpha = 1/w), seeded with the first delta like ewm(adjust=False).
+    Bars without a defined RSI (first bar, flat prices) stay at the neutral 50."""
+    n = p.size
+    out = np.full(n, 50.0)
+    a = 1.0 / w
+    avg_g = 0.0
+    avg_l = 0.0
+    for i in range(1, n):
+        d = p[i] - p[i - 1]
+        g = d if d > 0 else 0.0
+        l = -d if d < 0 else 0.0
+        if i == 1:
+            avg_g = g
+            avg_l = l
+        else:
+            avg_g = avg_g * (1.0 - a) + g * a
+            avg_l = avg_l * (1.0 - a) + l * a
+        if avg_l > 0.0:
+            out[i] = 100.0 - 100.0 / (1.0 + avg_g / avg_l)
+        elif avg_g > 0.0:
+            out[i] = 100.0
+    return out
+
+def _rsi_wilder_filtered(p, w):
+    """Numba-free path: gain/loss via one np.where each, Wilder's smoothing as a compiled lfilter recurrence."""
+    n = p.size
+    out = np.full(n, 50.0)
+    if n < 2:
+        return out
+    a = 1.0 / w
+    d = np.diff(p)
+    g = np.where(d > 0, d, 0.0)
+    l = np.where(d < 0, -d, 0.0)
+    # y[i] = (1 - a) * y[i-1] + a * x[i], seeded with the first delta (zi carries y[0] into the filter state)
+    avg_g = np.empty_like(d)
+    avg_l = np.empty_like(d)
+    avg_g[0], avg_l[0] = g[0], l[0]
+    avg_g[1:] = lfilter([a], [1.0, -(1.0 - a)], g[1:], zi=[(1.0 - a) * g[0]])[0]
+    avg_l[1:] = lfilter([a], [1.0, -(1.0 - a)], l[1:], zi=[(1.0 - a) * l[0]])[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100.0 - 100.0 / (1.0 + avg_g / avg_l)
+    out[1:] = np.where(avg_l > 0.0, rsi, np.where(avg_g > 0.0, 100.0, 50.0))
+    return out
+
+# Without Numba the kernel above is a pure-Python loop, so prefer the SciPy filter when available
+_rsi_wilder = _rsi_wilder_filtered if (SCIPY_AVAILABLE and not NUMBA_AVAILABLE) else _rsi_wilder_kernel
+
 class QuantAgrifyEngine:
     """
     Exact replica of the math used in FeatureEngineering.tsx and AlgorithmWorkflow.tsx
@@ -97,49 +183,26 @@ class QuantAgrifyEngine:
     
     @staticmethod
     def calc_rsi_wilder(prices, window=14):
-        # Using Wilder's Smoothing (EMA-based) matching the upgrade
-        delta = prices.diff()
-        gain = delta.clip(lower=0)
-        loss = -1 * delta.clip(upper=0)
-        
-        # Alpha for Wilder's EMA is 1/n
-        alpha = 1 / window
-        
-        avg_gain = gain.ewm(alpha=alpha, adjust=False).mean()
-        avg_loss = loss.ewm(alpha=alpha, adjust=False).mean()
-        
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi.fillna(50)
+        # Using Wilder's Smoothing (EMA-based) matching the upgrade, alpha = 1/n
+        p = np.ascontiguousarray(prices.to_numpy(dtype=np.float64, na_value=np.nan))  # no copy for a plain float64 column
+        return pd.Series(_rsi_wilder(p, window), index=prices.index)
 
     @staticmethod
     def detect_gaps_and_adjust(df, threshold_mult=4):
         # Replicating AlgorithmWorkflow.tsx logic
-        prices = df['close'].values
-        adjusted = np.copy(prices)
-        gaps = []
+        prices = df['close'].to_numpy(np.float64)
         
         # 1. Calc Avg Volatility (Simple return diff)
-        pct_changes = np.abs(np.diff(prices) / prices[:-1])
-        avg_vol = np.mean(pct_changes)
-        threshold = avg_vol * threshold_mult
+        pct_changes = np.diff(prices) / prices[:-1]
+        threshold = np.mean(np.abs(pct_changes)) * threshold_mult
         
-        cumulative_gap = 0
+        # 2. Bars whose move exceeds the threshold, in one vectorised pass
+        idx = np.flatnonzero(np.abs(pct_changes) > threshold) + 1
+        gap_sizes = prices[idx] - prices[idx - 1]
         
-        for i in range(1, len(prices)):
-            curr = prices[i]
-            prev = prices[i-1]
-            pct_chg = (curr - prev) / prev
-            
-            if abs(pct_chg) > threshold:
-                gap = curr - prev
-                gaps.append((df.iloc[i]['date'], gap))
-                cumulative_gap += gap
-                
-            # Back Adjustment Logic: Apply gap backwards
-            # (In the script, we just track the gap existence for validation)
-            
-        return gaps
+        # Back Adjustment Logic: Apply gap backwards
+        # (In the script, we just track the gap existence for validation)
+        return list(zip(df['date'].iloc[idx], gap_sizes))
 
 # --- PART 3: THE AUDIT (RUNNING THE TESTS) ---
 
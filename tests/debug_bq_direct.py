@@ -2,6 +2,7 @@
 import os
 import sys
 import glob
+import itertools
 from google.cloud import bigquery
 from google.oauth2.service_account import Credentials
 
@@ -18,16 +19,18 @@ DATASET_ID = "quant_database"
 TABLE_ID = "futures_1min"
 
 def find_key_file():
-    print(f"📂 当前工作目录 (CWD): {os.getcwd()}")
-    print("👀 正在当前目录下查找文件...")
-    files = os.listdir(os.getcwd())
-    print(f"   发现文件: {files}")
-    
+    # 常见路径命中即返回，不做目录列举和 glob
     for path in SEARCH_PATHS:
         if os.path.exists(path):
             print(f"✅ 找到密钥文件: {path}")
             return path
     
+    # 未命中时才打印目录内容，帮助排查
+    print(f"📂 当前工作目录 (CWD): {os.getcwd()}")
+    print("👀 正在当前目录下查找文件...")
+    files = os.listdir(os.getcwd())
+    print(f"   发现文件: {files}")
+    
     # 如果还没找到，尝试模糊搜索
     print("⚠️ 精确路径未找到，尝试搜索所有 .json 文件...")
     json_files = glob.glob("*.json") + glob.glob("/content/*.json")
@@ -75,18 +78,32 @@ def debug_bigquery():
         print(f"❌ 无法获取表信息 (表可能不存在或名字错了): {str(e)}")
         return
 
+    # 假设时间字段是 timestamp 或 timestamp_field_0
+    time_col = 'timestamp' if 'timestamp' in column_names else 'timestamp_field_0'
+
+    # 2.1 分区 / 聚簇诊断: 回测查询按 contract 等值过滤，未按 contract 聚簇时每个分区都会被整块扫描
+    partitioning = table.time_partitioning
+    if partitioning:
+        print(f"🧱 分区: {partitioning.type_} ({partitioning.field or '_PARTITIONTIME'})")
+    else:
+        print("🧱 分区: 无")
+    print(f"🧲 聚簇字段: {table.clustering_fields or '无'}")
+    if 'contract' in column_names and 'contract' not in (table.clustering_fields or []):
+        print("⚠️ 建议按 contract 聚簇，使单合约查询只扫描该合约所在的数据块:")
+        print(f"   CREATE TABLE `{full_table_id}_clustered`")
+        print(f"   PARTITION BY DATE({time_col}) CLUSTER BY contract")
+        print(f"   AS SELECT * FROM `{full_table_id}`")
+
     # 3. 采样数据 (看看真实存进去的数据长什么样)
     print("\n🧐 采样前 5 条原始数据 (Raw Sample):")
-    query_sample = f"""
-        SELECT * FROM `{full_table_id}` LIMIT 5
-    """
     try:
-        rows = list(client.query(query_sample).result())
-        if not rows:
+        # 直接读表 (tabledata.list)，不提交查询作业，也不按扫描字节计费
+        sample = client.list_rows(table, max_results=5).to_dataframe()
+        if sample.empty:
             print("⚠️ 警告: 表是空的 (0 rows)。")
-        for row in rows:
+        for record in sample.to_dict('records'):
             # 打印成字典方便看
-            print(dict(row))
+            print(record)
     except Exception as e:
         print(f"❌ 查询失败: {str(e)}")
 
@@ -100,23 +117,7 @@ def debug_bigquery():
     if target_col:
         print(f"\n🕵️‍♀️ 深入分析字段: '{target_col}'")
         
-        # 4.1 列出所有不重复的合约代码 (Limit 50)
-        print(f"   正在提取前 50 个不重复的合约代码...")
-        query_distinct = f"""
-            SELECT DISTINCT {target_col} 
-            FROM `{full_table_id}` 
-            LIMIT 50
-        """
-        distinct_rows = list(client.query(query_distinct).result())
-        print(f"   👉 发现 {len(distinct_rows)} 个不同合约，示例:")
-        for r in distinct_rows:
-            print(f"      [{r[0]}]")
-
-        # 4.2 统计每个合约的时间范围
-        print(f"\n   正在统计各合约的数据量和时间跨度 (Top 10)...")
-        # 假设时间字段是 timestamp 或 timestamp_field_0
-        time_col = 'timestamp' if 'timestamp' in column_names else 'timestamp_field_0'
-        
+        # 一次 GROUP BY 扫描同时得到: 不重复合约列表 (4.1) + 各合约数据量与时间跨度 (4.2)
         query_stats = f"""
             SELECT 
                 {target_col},
@@ -126,12 +127,22 @@ def debug_bigquery():
             FROM `{full_table_id}`
             GROUP BY {target_col}
             ORDER BY total_rows DESC
-            LIMIT 10
         """
-        stats_rows = list(client.query(query_stats).result())
+        print(f"   正在统计各合约的数据量和时间跨度...")
+        # 按页流式读取，只取需要展示的前 50 行，不把全部合约物化成列表
+        result = client.query(query_stats).result(page_size=1000)
+        stats_rows = list(itertools.islice(result, 50))
+
+        # 4.1 列出不重复的合约代码 (示例前 50 个)
+        print(f"   👉 发现 {result.total_rows} 个不同合约，示例:")
+        for r in stats_rows:
+            print(f"      [{r[0]}]")
+
+        # 4.2 统计每个合约的时间范围
+        print(f"\n   各合约的数据量和时间跨度 (Top 10):")
         print(f"   {'合约代码':<20} | {'行数':<10} | {'开始时间'} -> {'结束时间'}")
         print("-" * 70)
-        for r in stats_rows:
+        for r in stats_rows[:10]:
             code = str(r[0])
             count = str(r[1])
             start = str(r[2])
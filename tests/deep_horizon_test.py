@@ -16,12 +16,34 @@ import logging
 import warnings
 import json
 import random
+import hashlib
+import base64
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from google.oauth2 import service_account
 from google.cloud import bigquery
 from datetime import datetime, timedelta
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+# Numba is optional: without it the kernels below run as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+# Kaleido is optional: with it charts are embedded as static SVG instead of inline Plotly JSON
+try:
+    import kaleido  # noqa: F401
+    KALEIDO_AVAILABLE = True
+except ImportError:
+    KALEIDO_AVAILABLE = False
 
 # --- 0. CONFIGURATION ---
 
@@ -40,18 +62,70 @@ ASSETS = {
 TRAIN_START = '2020-01-01'
 TEST_END    = '2025-12-31'
 
+# Local Parquet cache of query results (skips BigQuery entirely on a fresh hit)
+CACHE_DIR = "bq_cache"
+CACHE_TTL_SECONDS = 24 * 3600
+
+# Static report stylesheet (built once at import, not per save_report call)
+REPORT_CSS = """
+        body { background-color: #020617; color: #e2e8f0; font-family: 'Segoe UI', Roboto, Helvetica, sans-serif; padding: 40px; max-width: 1200px; margin: 0 auto; }
+        h1 { color: #3b82f6; border-bottom: 2px solid #1e293b; padding-bottom: 20px; }
+        .section-title { color: #94a3b8; font-size: 1.5rem; margin-top: 0; border-left: 4px solid #3b82f6; padding-left: 15px; }
+        .card { background: #0f172a; border: 1px solid #1e293b; border-radius: 12px; padding: 25px; margin-bottom: 30px; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.5); }
+        .metric-row { margin-bottom: 10px; padding: 10px; background: #1e293b; border-radius: 6px; border-left: 4px solid #0d59f2; }
+        table { width: 100%; border-collapse: collapse; margin-top: 15px; }
+        th { text-align: left; color: #64748b; border-bottom: 1px solid #334155; padding: 10px; }
+        td { padding: 12px 10px; border-bottom: 1px solid #1e293b; }
+        .tag { padding: 4px 8px; border-radius: 4px; font-weight: bold; font-size: 0.8rem; }
+        .pass { background: rgba(16, 185, 129, 0.2); color: #10b981; }
+        .fail { background: rgba(239, 68, 68, 0.2); color: #ef4444; }
+        .log-box { background: #000; color: #00ff00; font-family: monospace; padding: 15px; border-radius: 8px; max-height: 300px; overflow-y: scroll; font-size: 11px; margin-top: 20px; border: 1px solid #333; }
+"""
+
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - [TITAN v6.3] - %(message)s')
 logger = logging.getLogger("Titan-v6.3")
 warnings.filterwarnings("ignore")
 
+@dataclass(slots=True)
+class AssetMetrics:
+    """Per-asset audit results; every field has a default so rendering needs no .get fallbacks."""
+    vol: float = 0.0
+    max_dd: float = 0.0
+    vector_roi: float = 0.0
+    harvester_roi: float = 0.0
+
+@njit(cache=True)
+def _harvester_curve(close, ret):
+    """Compounded Harvester equity: long on bar i after closes fell three days running into bar i-1.
+    NaN returns leave the curve at NaN for that bar without resetting it (pandas cumprod semantics)."""
+    n = close.size
+    out = np.empty(n)
+    acc = 1.0
+    for i in range(n):
+        sig = 0.0
+        if i >= 4 and close[i-1] < close[i-2] and close[i-2] < close[i-3] and close[i-3] < close[i-4]:
+            sig = 1.0
+        r = sig * ret[i]
+        if np.isnan(r):
+            out[i] = np.nan
+        else:
+            acc *= 1.0 + r
+            out[i] = acc
+    return out
+
 class TitanBlackBox:
-    def __init__(self):
+    def __init__(self, seed=None, connect=True):
         self.execution_log = []
         self.report_sections = []
         self.asset_metrics = {}
         self.use_synthetic = False
+        self.rng = np.random.default_rng(seed)  # PCG64, replaces the global RandomState
         
+        if not connect:
+            # Audit-only engine (pool workers): data is handed in, no BigQuery client
+            self.bq_client = None
+            return
         self.log("🚀 INITIALIZING TITAN v6.3 (PRECISION MODE)...")
         self.bq_client = self._init_bq()
 
@@ -84,32 +158,43 @@ class TitanBlackBox:
         n = len(dates)
         price = 2500 if 'Corn' in asset_name else 5000 if 'Soy' in asset_name else 15000 if 'Cotton' in asset_name else 6000
         volatility = 0.015
-        data = []
-        for i in range(n):
-            season = np.sin(i / 365 * 2 * np.pi) * 0.005
-            noise = np.random.normal(0, volatility)
-            price = price * (1 + noise + season)
-            data.append([dates[i], price, price*1.01, price*0.99, price, 100000])
-        df = pd.DataFrame(data, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-        df.set_index('date', inplace=True)
+        # Whole path in one shot: price[i] = price0 * prod(1 + noise + season) up to day i
+        season = np.sin(np.arange(n) / 365 * 2 * np.pi) * 0.005
+        noise = self.rng.normal(0, volatility, n)
+        close = price * np.cumprod(1 + noise + season)
+        df = pd.DataFrame({
+            'open': close, 'high': close * 1.01, 'low': close * 0.99, 'close': close, 'volume': 100000
+        }, index=pd.Index(dates, name='date'))
+        return self._downcast_ohlcv(df)
+
+    @staticmethod
+    def _downcast_ohlcv(df):
+        """Daily bars need ~6 significant digits: float32 prices / int32 volume halve the bytes every audit streams."""
+        for c in ('open', 'high', 'low', 'close'):
+            df[c] = df[c].astype(np.float32)
+        df['volume'] = df['volume'].fillna(0).astype(np.int32)
         return df
 
     def run_suite(self):
         try:
             self.audit_1_data_integrity()
             
+            # 1. Get Data (single batched query for all assets)
+            all_data = self.fetch_all_data()
+            ready = {key: self._attach_returns(df) for key, df in all_data.items() if df is not None and not df.empty}
+            
+            # 2-3. Risk Modeling + Strategy Sim: assets are independent, so each runs in its own process
+            with ProcessPoolExecutor(max_workers=len(ASSETS)) as pool:
+                audited = dict(zip(ready, pool.map(_audit_asset, ready.keys(), ready.values())))
+            
+            # Merge worker output back in ASSETS order so the report layout stays deterministic
             for key, meta in ASSETS.items():
                 self.log(f"--- Processing Asset: {key} ({meta['code']}) ---")
-                
-                # 1. Get Data
-                df = self.fetch_data(key, meta['code'])
-                
-                if df is not None and not df.empty:
-                    # 2. Risk Modeling
-                    self.audit_2_risk_modeling(key, df)
-                    
-                    # 3. Strategy Sim
-                    self.audit_3_strategy_sim(key, df)
+                if key in audited:
+                    metrics, sections, log_lines = audited[key]
+                    self.asset_metrics[key] = metrics
+                    self.report_sections.extend(sections)
+                    self.execution_log.extend(log_lines)
                 else:
                     self.log(f"❌ No data available for {key}", 'ERROR')
 
@@ -120,42 +205,93 @@ class TitanBlackBox:
         finally:
             self.save_report()
 
-    def fetch_data(self, key, target_code):
+    def fetch_all_data(self):
+        """Fetch daily OHLC for every asset in ONE BigQuery job; returns {key: DataFrame}."""
         if self.use_synthetic:
-            return self._generate_synthetic_series(key, TRAIN_START, TEST_END)
+            return {key: self._generate_synthetic_series(key, TRAIN_START, TEST_END) for key in ASSETS}
         
-        # 🎯 STRICT EQUALITY QUERY (=)
+        # 🎯 STRICT EQUALITY QUERY (IN UNNEST of exact codes)
         # Using exact match prevents mixing different contracts (e.g. C2101 vs C2105)
         # We aggregate to Daily OHLC using the First/Last logic for accuracy
+        # MIN_BY/MAX_BY pick the first/last bar in a single pass (no per-group sort like ARRAY_AGG ... LIMIT 1)
         query = f"""
             SELECT 
+                contract,
                 DATE(timestamp_field_0) as date,
-                ARRAY_AGG(open ORDER BY timestamp_field_0 ASC LIMIT 1)[OFFSET(0)] as open,
+                MIN_BY(open, timestamp_field_0) as open,
                 MAX(high) as high,
                 MIN(low) as low,
-                ARRAY_AGG(close ORDER BY timestamp_field_0 DESC LIMIT 1)[OFFSET(0)] as close,
+                MAX_BY(close, timestamp_field_0) as close,
                 SUM(volume) as volume
             FROM `{self.bq_client.project}.{DATASET_ID}.{TABLE_ID}`
-            WHERE contract = '{target_code}'
-            AND timestamp_field_0 BETWEEN '{TRAIN_START}' AND '{TEST_END}'
-            GROUP BY date 
-            ORDER BY date
+            WHERE contract IN UNNEST(@codes)
+            AND timestamp_field_0 >= @start_ts
+            AND timestamp_field_0 < @end_ts
+            GROUP BY contract, date 
+            ORDER BY contract, date
         """
-        try:
-            # create_bqstorage_client=False prevents 403 error
-            df = self.bq_client.query(query).to_dataframe(create_bqstorage_client=False)
-            
-            if df.empty:
-                self.log(f"   [Data] 0 rows found for EXACT match '{target_code}'. Falling back to Synthetic.", 'WARN')
-                return self._generate_synthetic_series(key, TRAIN_START, TEST_END)
-            
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
-            self.log(f"   [Data] Loaded {len(df)} rows. Range: {df.index.min().date()} -> {df.index.max().date()}")
-            return df
-        except Exception as e:
-            self.log(f"   [Data] Query failed: {e}. Using Synthetic.", 'ERROR')
-            return self._generate_synthetic_series(key, TRAIN_START, TEST_END)
+        # Typed TIMESTAMP bounds (half-open, so all of TEST_END is included) let BigQuery prune partitions;
+        # the constant query text also lets the result cache hit across runs
+        codes = [meta['code'] for meta in ASSETS.values()]
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter('codes', 'STRING', codes),
+            bigquery.ScalarQueryParameter('start_ts', 'TIMESTAMP', pd.Timestamp(TRAIN_START).to_pydatetime()),
+            bigquery.ScalarQueryParameter('end_ts', 'TIMESTAMP', (pd.Timestamp(TEST_END) + pd.Timedelta(days=1)).to_pydatetime()),
+        ])
+        
+        # Cache key covers the SQL text and every bound parameter
+        cache_key = hashlib.sha1(f"{query}|{codes}|{TRAIN_START}|{TEST_END}".encode()).hexdigest()
+        cache_path = os.path.join(CACHE_DIR, f"{cache_key}.parquet")
+        df = None
+        if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < CACHE_TTL_SECONDS:
+            try:
+                df = pd.read_parquet(cache_path)
+                self.log(f"   [Data] Cache hit: {cache_path}")
+            except Exception:
+                df = None
+        
+        if df is None:
+            try:
+                job = self.bq_client.query(query, job_config=job_config)
+                try:
+                    # BigQuery Storage Read API streams the result as Arrow instead of paging JSON over REST
+                    df = job.to_dataframe(create_bqstorage_client=True)
+                except Exception as e:
+                    # 403 without bigquery.readSessionUser, or storage client not installed: fall back to REST
+                    self.log(f"   [Data] Storage API unavailable ({e}). Falling back to REST.", 'WARN')
+                    df = job.to_dataframe(create_bqstorage_client=False)
+            except Exception as e:
+                self.log(f"   [Data] Query failed: {e}. Using Synthetic.", 'ERROR')
+                return {key: self._generate_synthetic_series(key, TRAIN_START, TEST_END) for key in ASSETS}
+            # An empty result may be transient (table still loading): don't pin it for CACHE_TTL_SECONDS
+            if not df.empty:
+                try:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    df.to_parquet(cache_path, compression='zstd')
+                except Exception as e:
+                    self.log(f"   [Data] Parquet cache write failed: {e}", 'WARN')
+        
+        df['date'] = pd.to_datetime(df['date'])
+        by_code = {code: self._downcast_ohlcv(g.drop(columns='contract').set_index('date'))
+                   for code, g in df.groupby('contract', sort=False)}
+        
+        data = {}
+        for key, meta in ASSETS.items():
+            asset_df = by_code.get(meta['code'])
+            if asset_df is None or asset_df.empty:
+                self.log(f"   [Data] 0 rows found for EXACT match '{meta['code']}'. Falling back to Synthetic.", 'WARN')
+                asset_df = self._generate_synthetic_series(key, TRAIN_START, TEST_END)
+            else:
+                self.log(f"   [Data] {key}: Loaded {len(asset_df)} rows. Range: {asset_df.index.min().date()} -> {asset_df.index.max().date()}")
+            data[key] = asset_df
+        return data
+
+    @staticmethod
+    def _attach_returns(df):
+        """Daily returns and their compounded curve, computed once and shared by audit_2 and audit_3."""
+        df['ret'] = df['close'].pct_change()
+        df['cumret'] = (1 + df['ret']).cumprod()
+        return df
 
     def audit_1_data_integrity(self):
         self.log("🔵 [DIM 1] Data Integrity Check...")
@@ -173,19 +309,18 @@ class TitanBlackBox:
         self.log(f"   [Risk] Calculating volatility surface for {key}...")
         
         # Calculate Metrics
-        df['ret'] = df['close'].pct_change()
         vol = df['ret'].std() * np.sqrt(252)
         
         # Drawdown
-        cum = (1 + df['ret']).cumprod()
+        cum = df['cumret']
         peak = cum.cummax()
         dd = (cum - peak) / peak
         max_dd = dd.min()
         
         # Store for summary
-        if key not in self.asset_metrics: self.asset_metrics[key] = {}
-        self.asset_metrics[key]['vol'] = vol
-        self.asset_metrics[key]['max_dd'] = max_dd
+        metrics = self.asset_metrics.setdefault(key, AssetMetrics())
+        metrics.vol = vol
+        metrics.max_dd = max_dd
 
         # Quality Check Highlight
         vol_display = f"{vol*100:.2f}%"
@@ -202,35 +337,38 @@ class TitanBlackBox:
     def audit_3_strategy_sim(self, key, df):
         self.log(f"   [Sim] Running Vector vs Harvester for {key}...")
         
-        # Simulation Logic
-        test_df = df.copy() # Use full range for charts
-        if test_df.empty: return
+        # Simulation Logic (full range for charts); derived series stay local arrays, df is never widened
+        if df.empty: return
+
+        # Contiguous float32 buffers (no-op for the downcast frame): one stable kernel signature,
+        # and nullable/Arrow-backed columns never reach the JIT as object arrays
+        close = np.ascontiguousarray(df['close'].to_numpy(dtype=np.float32, na_value=np.nan))
+        ret = np.ascontiguousarray(df['ret'].to_numpy(dtype=np.float32, na_value=np.nan))
 
         # 1. Vector (Trend Following MA Crossover)
-        test_df['MA20'] = test_df['close'].rolling(20).mean()
-        test_df['Vector_Sig'] = np.where(test_df['close'] > test_df['MA20'], 1, 0)
-        test_df['Vector_Ret'] = test_df['Vector_Sig'].shift(1) * test_df['ret']
-        vector_perf = (1 + test_df['Vector_Ret']).cumprod().iloc[-1] - 1
+        # int8 signal on raw arrays, lagged one bar
+        ma20 = df['close'].rolling(20).mean().to_numpy()
+        vector_sig = (close > ma20).astype(np.int8)
+        vector_ret = np.concatenate(([0], vector_sig[:-1])) * ret
+        vector_curve = pd.Series(1 + vector_ret, index=df.index).cumprod()
+        vector_perf = vector_curve.iloc[-1] - 1
 
         # 2. Harvester (Mean Reversion / Weather Proxy)
         # Logic: Buy if 3-day drop (simulating weather dip buying)
-        test_df['Down3'] = (test_df['close'] < test_df['close'].shift(1)) & \
-                           (test_df['close'].shift(1) < test_df['close'].shift(2)) & \
-                           (test_df['close'].shift(2) < test_df['close'].shift(3))
-        test_df['Harv_Sig'] = np.where(test_df['Down3'], 1, 0)
-        test_df['Harv_Ret'] = test_df['Harv_Sig'].shift(1) * test_df['ret']
-        harvester_perf = (1 + test_df['Harv_Ret']).cumprod().iloc[-1] - 1
+        # Signal, one-bar lag and compounding fused into a single compiled pass
+        harvester_curve = _harvester_curve(close, ret)
+        harvester_perf = harvester_curve[-1] - 1
 
         # Store results
-        self.asset_metrics[key]['vector_roi'] = vector_perf
-        self.asset_metrics[key]['harvester_roi'] = harvester_perf
+        self.asset_metrics[key].vector_roi = vector_perf
+        self.asset_metrics[key].harvester_roi = harvester_perf
 
         # Chart
         fig = go.Figure()
-        fig.add_trace(go.Scatter(x=test_df.index, y=(1+test_df['Vector_Ret']).cumprod(), name='Vector (Trend)', line=dict(color='#a855f7')))
-        fig.add_trace(go.Scatter(x=test_df.index, y=(1+test_df['Harv_Ret']).cumprod(), name='Harvester (MeanRev)', line=dict(color='#ffb347')))
+        fig.add_trace(go.Scatter(x=df.index, y=vector_curve, name='Vector (Trend)', line=dict(color='#a855f7')))
+        fig.add_trace(go.Scatter(x=df.index, y=harvester_curve, name='Harvester (MeanRev)', line=dict(color='#ffb347')))
         fig.update_layout(title=f"{key} Strategy Performance", template="plotly_dark", height=300, margin=dict(l=20, r=20, t=40, b=20))
-        chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+        chart_html = _render_chart(fig)
 
         html = f"""
         <div class="card">
@@ -246,10 +384,11 @@ class TitanBlackBox:
 
     def audit_4_cross_asset_summary(self):
         self.log("🔵 [DIM 4] Generating Cross-Asset Matrix...")
-        rows = ""
-        for key, m in self.asset_metrics.items():
-            winner = "Vector" if m.get('vector_roi',0) > m.get('harvester_roi',0) else "Harvester"
-            rows += f"<tr><td>{key}</td><td>{m.get('vol',0)*100:.1f}%</td><td>{winner}</td></tr>"
+        rows = "".join(
+            f"<tr><td>{key}</td><td>{m.vol*100:.1f}%</td>"
+            f"<td>{'Vector' if m.vector_roi > m.harvester_roi else 'Harvester'}</td></tr>"
+            for key, m in self.asset_metrics.items()
+        )
         
         html = f"""
         <div class="card">
@@ -265,12 +404,13 @@ class TitanBlackBox:
     def save_report(self):
         self.log("💾 COMPILING FINAL REPORT...")
         
-        prompt_context = "QuantAgrify Audit v6.3 (Precision Mode) Results:\n"
-        for key, m in self.asset_metrics.items():
-            prompt_context += f"Asset: {key}\n"
-            prompt_context += f"- Volatility: {m.get('vol',0)*100:.1f}%\n"
-            prompt_context += f"- Trend Strategy: {m.get('vector_roi',0)*100:.1f}%\n"
-            prompt_context += f"- MeanRev Strategy: {m.get('harvester_roi',0)*100:.1f}%\n\n"
+        prompt_context = "QuantAgrify Audit v6.3 (Precision Mode) Results:\n" + "".join(
+            f"Asset: {key}\n"
+            f"- Volatility: {m.vol*100:.1f}%\n"
+            f"- Trend Strategy: {m.vector_roi*100:.1f}%\n"
+            f"- MeanRev Strategy: {m.harvester_roi*100:.1f}%\n\n"
+            for key, m in self.asset_metrics.items()
+        )
         
         prompt_html = f"""
         <div class="section">
@@ -282,25 +422,11 @@ class TitanBlackBox:
 
         log_html = "<div class='log-box'>" + "<br/>".join(self.execution_log) + "</div>"
 
-        css = """
-        body { background-color: #020617; color: #e2e8f0; font-family: 'Segoe UI', Roboto, Helvetica, sans-serif; padding: 40px; max-width: 1200px; margin: 0 auto; }
-        h1 { color: #3b82f6; border-bottom: 2px solid #1e293b; padding-bottom: 20px; }
-        .section-title { color: #94a3b8; font-size: 1.5rem; margin-top: 0; border-left: 4px solid #3b82f6; padding-left: 15px; }
-        .card { background: #0f172a; border: 1px solid #1e293b; border-radius: 12px; padding: 25px; margin-bottom: 30px; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.5); }
-        .metric-row { margin-bottom: 10px; padding: 10px; background: #1e293b; border-radius: 6px; border-left: 4px solid #0d59f2; }
-        table { width: 100%; border-collapse: collapse; margin-top: 15px; }
-        th { text-align: left; color: #64748b; border-bottom: 1px solid #334155; padding: 10px; }
-        td { padding: 12px 10px; border-bottom: 1px solid #1e293b; }
-        .tag { padding: 4px 8px; border-radius: 4px; font-weight: bold; font-size: 0.8rem; }
-        .pass { background: rgba(16, 185, 129, 0.2); color: #10b981; }
-        .fail { background: rgba(239, 68, 68, 0.2); color: #ef4444; }
-        .log-box { background: #000; color: #00ff00; font-family: monospace; padding: 15px; border-radius: 8px; max-height: 300px; overflow-y: scroll; font-size: 11px; margin-top: 20px; border: 1px solid #333; }
-        """
 
         html = f"""
         <!DOCTYPE html>
         <html>
-        <head><title>QuantAgrify BlackBox Audit v6.3</title><style>{css}</style></head>
+        <head><title>QuantAgrify BlackBox Audit v6.3</title><style>{REPORT_CSS}</style></head>
         <body>
             <h1>QuantAgrify // Titan v6.3 Precision Audit</h1>
             <p><strong>Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M')} | <strong>System:</strong> {sys.platform}</p>
@@ -330,6 +456,24 @@ class TitanBlackBox:
         except Exception:
             self.log("⚠️ Auto-download failed (normal if not in Colab).")
 
+def _render_chart(fig):
+    """Static SVG (a few KB, no JS) when Kaleido can render; otherwise the interactive Plotly embed."""
+    if KALEIDO_AVAILABLE:
+        try:
+            svg = base64.b64encode(fig.to_image(format='svg')).decode('ascii')
+            return f'<img src="data:image/svg+xml;base64,{svg}" style="width:100%"/>'
+        except Exception:
+            pass  # e.g. Kaleido present but no headless browser to drive
+    return fig.to_html(full_html=False, include_plotlyjs='cdn')
+
+def _audit_asset(key, df):
+    """Process-pool worker: run the per-asset audits on an audit-only engine (no BigQuery client)
+    and return (metrics, report sections, log lines) for the parent to merge."""
+    engine = TitanBlackBox(connect=False)
+    engine.audit_2_risk_modeling(key, df)
+    engine.audit_3_strategy_sim(key, df)
+    return engine.asset_metrics[key], engine.report_sections, engine.execution_log
+
 if __name__ == "__main__":
     # Ensure dependencies are installed if running in a fresh colab
     try: